@@ -21,6 +21,16 @@ class Settings(BaseSettings):
     # MongoDB
     MONGODB_URI: str
     DATABASE_NAME: str
+    MONGO_ENSURE_INDEXES: bool = True  # create missing indexes on startup (see app/services/db_indexes.py)
+
+    # Remote assignment API (one pooled client per process, see db_service.open_http_client)
+    REMOTE_API_MAX_CONNECTIONS: int = 50
+    REMOTE_API_MAX_KEEPALIVE: int = 20  # idle connections kept open for reuse
+    REMOTE_API_KEEPALIVE_EXPIRY: float = 30.0  # seconds an idle connection is kept
+    REMOTE_API_HTTP2: bool = True  # only takes effect when the h2 package is installed
+    REMOTE_API_CONNECT_TIMEOUT: float = 10.0  # seconds
+    REMOTE_API_TIMEOUT: float = 60.0  # seconds, regular API calls
+    REMOTE_API_DOWNLOAD_TIMEOUT: float = 120.0  # seconds, file downloads
     
     # YouTube
     YOUTUBE_API_KEY: str
@@ -28,6 +38,69 @@ class Settings(BaseSettings):
     # App
     UPLOAD_DIR: str = "temp"
     MAX_FILE_SIZE: int = 10485760  # 10MB
+    UPLOAD_CHUNK_SIZE: int = 1048576  # bytes read per chunk when streaming uploads
+    UPLOAD_SPOOL_MAX_MEMORY: int = 8388608  # uploads up to this size are OCR'd from memory, larger ones spill to UPLOAD_DIR
+    S3_MULTIPART_PART_SIZE: int = 8388608  # 8MB, S3 requires at least 5MB per part
+    UPLOAD_IDEMPOTENCY_WAIT_SECONDS: float = 30.0  # how long a retry waits for the original request before 409
+    UPLOAD_IDEMPOTENCY_LEASE_SECONDS: int = 120  # a request that stops renewing this is presumed dead and taken over
+    UPLOAD_IDEMPOTENCY_TTL_SECONDS: int = 86400  # how long keys and their results are kept
+    UPLOAD_SESSION_TTL_SECONDS: int = 86400  # a resumable upload untouched this long expires, staged bytes included
+    UPLOAD_SWEEP_INTERVAL_SECONDS: int = 3600  # how often abandoned staged uploads are swept from UPLOAD_DIR
+
+    # Async ingest worker (python -m app.worker)
+    INGEST_WORKER_CONCURRENCY: int = 4  # files processed in parallel per worker
+    INGEST_LEASE_SECONDS: int = 300  # a job whose worker stops renewing its lease is picked up again
+    INGEST_POLL_INTERVAL: float = 2.0  # seconds between queue polls when idle
+    INGEST_MAX_ATTEMPTS: int = 3
+    UPLOAD_FILE_CONCURRENCY: int = 4  # files processed in parallel per bulk upload request
+    UPLOAD_GLOBAL_CONCURRENCY: int = 8  # files processed in parallel across all requests
+
+    # OCR
+    OCR_PAGE_CONCURRENCY: int = 4  # pages OCR'd in parallel per document
+    OCR_MAX_CONCURRENCY: int = 16  # vision requests in flight across the whole process
+    OCR_MAX_CONNECTIONS: int = 20  # connection pool size of the OCR client
+    OCR_REQUEST_TIMEOUT: float = 120.0  # seconds
+    OCR_CONNECT_TIMEOUT: float = 10.0  # seconds
+    OCR_MAX_RETRIES: int = 3  # retries on 429 / 5xx / connection errors
+    OCR_RETRY_BASE_DELAY: float = 1.0  # seconds, doubled per retry
+    OCR_PDF_MODE: str = "hybrid"  # "hybrid" (text layer first) or "ocr" (vision on every page)
+    OCR_TEXT_LAYER_MIN_SCORE: float = 0.6  # below this a page's text layer is re-done with OCR
+    OCR_PAGE_CACHE_ENABLED: bool = True  # reuse OCR text for identical page images across assignments
+    OCR_LEASE_SECONDS: int = 120  # cross-process OCR lease per assignment, renewed while the OCR runs
+    OCR_SINGLE_FLIGHT_WAIT_SECONDS: float = 90.0  # how long to wait on another process's OCR before running it here
+    OCR_LEASE_POLL_INTERVAL: float = 1.0  # seconds between cache checks while another process holds the lease
+    OCR_RENDER_TARGET_PX: int = 1024  # short side of the rendered page (GPT-4o downsamples to 768 anyway)
+    OCR_RENDER_MIN_GLYPH_PX: int = 14  # raise zoom until the dominant font is at least this tall
+    OCR_RENDER_MIN_ZOOM: float = 1.0
+    OCR_RENDER_MAX_ZOOM: float = 3.0
+    OCR_IMAGE_FORMAT: str = "jpeg"  # "jpeg" or "png"
+    OCR_JPEG_QUALITY: int = 80  # clamped to 30-95
+    OCR_IMAGE_GRAYSCALE: bool = True
+    OCR_TRIM_MARGINS: bool = True
+    OCR_RENDER_IN_PROCESS_POOL: bool = True  # rasterize pages in a process pool instead of threads
+    OCR_RENDER_WORKERS: int = 0  # render processes, 0 = one per CPU core
+    OCR_RENDER_QUEUE_SIZE: int = 8  # rendered pages waiting for OCR before rendering pauses
+    OCR_BATCH_MODE: bool = False  # pack several pages into one vision request
+    OCR_BATCH_MAX_PAGES: int = 4
+    OCR_BATCH_TOKEN_BUDGET: int = 8000  # estimated image tokens + reserved output tokens per request
+    OCR_BATCH_OUTPUT_TOKENS_PER_PAGE: int = 1000
+    OCR_SKIP_BLANK_PAGES: bool = True
+    OCR_BLANK_INK_RATIO: float = 0.0005  # pages with less dark-pixel coverage are blank
+    OCR_SKIP_DUPLICATE_PAGES: bool = False  # reuse OCR text for near-identical pages (confirmed by a pixel diff)
+    OCR_DUPLICATE_MAX_DISTANCE: float = 0.03  # max fraction of differing hash bits (inked cells only) for a candidate
+    OCR_DUPLICATE_MAX_PIXEL_DIFF: float = 0.002  # max fraction of inked pixels that may differ in the confirming diff
+
+    # Chat
+    CHAT_LAZY_OCR: bool = True  # on a cache miss, OCR only the first pages and finish the rest in the background
+    CHAT_LAZY_OCR_PAGES: int = 3
+    OCR_BACKGROUND_MAX_ATTEMPTS: int = 5  # incomplete OCR passes before a partial result is left as it is
+    OCR_BACKGROUND_RETRY_DELAY: float = 60.0  # seconds before retrying failed pages, doubled per attempt
+    CHAT_HISTORY_WINDOW: int = 20  # previous messages sent to the model each turn
+    CHAT_HISTORY_PAGE_MAX: int = 100  # largest page /chatbot/history returns
+    ASSIGNMENT_CACHE_ENABLED: bool = True  # cache composed assignments between chat turns
+    ASSIGNMENT_CACHE_MAX_BYTES: int = 67108864  # 64MB of cached assignments per process
+    ASSIGNMENT_CACHE_TTL_SECONDS: int = 600
+    ASSIGNMENT_CACHE_SHARED: bool = False  # also keep entries in Mongo, shared across replicas
     
     class Config:
         env_file = ".env"
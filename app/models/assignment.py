@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class AssignmentPage(BaseModel):
@@ -21,20 +21,40 @@ class AssignmentResponse(BaseModel):
     total_pages: int
     upload_date: datetime
     status: str
+    timings: Optional[Dict[str, float]] = None  # per-stage seconds, bulk upload only
+    verification: Optional[dict] = None  # post-save check, bulk upload with verify=true only
 
 class AssignmentList(BaseModel):
     assignments: List[AssignmentResponse]
     total: int
 
+# Bulk upload result per file; full_text / pages only with response_mode "pages" / "full"
+class UploadedAssignment(AssignmentResponse):
+    full_text_length: int = 0
+    full_text: Optional[str] = None
+    pages: Optional[List[dict]] = None
+
 # NEW: For handling failed uploads in bulk
 class FailedUpload(BaseModel):
     file_name: str
     error: str
+    timings: Optional[Dict[str, float]] = None
 
 # NEW: For bulk upload response
 class BulkUploadResponse(BaseModel):
-    successful: List[AssignmentResponse]
+    successful: List[UploadedAssignment]
     failed: List[FailedUpload]
     total_processed: int
     total_successful: int
-    total_failed: int
\ No newline at end of file
+    total_failed: int
+    elapsed_seconds: Optional[float] = None
+
+# Resumable (offset-based) upload of a single large file
+class ResumableUploadCreate(BaseModel):
+    file_name: str
+    size: int  # total bytes the client will send
+    title: str
+    teacher_id: str
+    subject: Optional[str] = None
+    content_type: Optional[str] = None
+    verify: bool = False
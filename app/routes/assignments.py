@@ -1,32 +1,123 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
-from typing import List, Optional
-from app.services.file_processor import process_uploaded_file, cleanup_temp_files
-from app.services.s3_service import upload_to_s3
-from app.services.ocr_service import extract_text_from_file
-from app.services.db_service import save_assignment, get_all_assignments, get_assignment_by_id, get_assignment_full_text
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Header, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import List, Literal, Optional
+from app.services.file_processor import (
+    cleanup_temp_files,
+    cleanup_temp_file,
+    parse_upload_manifest,
+    sweep_stale_staged_uploads,
+    StagedUpload,
+    ZipMemberUpload,
+    FileTooLargeError
+)
+from app.services.s3_service import get_content_type
+from app.services.ingest_service import (
+    ingest_upload,
+    enqueue_uploads,
+    get_ingest_status,
+    begin_idempotent_upload,
+    upload_fingerprint,
+    enqueue_staged_file,
+    IdempotencyConflictError
+)
+from app.services import db_service
+from app.services.db_service import (
+    get_all_assignments,
+    get_assignment_by_id,
+    get_assignment_full_text,
+    get_ocr_job_progress,
+    invalidate_assignment_cache
+)
+from app.config import settings
 from app.models.assignment import (
-    AssignmentResponse, 
     AssignmentList,
     BulkUploadResponse, 
-    FailedUpload
+    FailedUpload,
+    ResumableUploadCreate
 )
-import uuid
-from datetime import datetime
 import asyncio
+import os
+import time
+import uuid
+import zipfile
 
 router = APIRouter()
 
 
-@router.post("/assignments/upload-multiple", response_model=BulkUploadResponse)
+def _apply_response_mode(data: dict, response_mode: str) -> dict:
+    """
+    summary: ids, page counts and text lengths only; pages: plus every page's
+    content; full: plus the full text. The full text and pages can always be
+    fetched later from /assignments/{id}/full-text and /assignments/{id}/pages.
+    """
+    if response_mode != "full":
+        data.pop("full_text", None)
+    if response_mode == "summary":
+        data.pop("pages", None)
+    return data
+
+
+async def _bulk_upload_response(results: list, temp_files: list, started: float) -> BulkUploadResponse:
+    successful = []
+    failed = []
+
+    # Separate successful uploads from failures
+    for result in results:
+        if isinstance(result, Exception):
+            failed.append(FailedUpload(file_name="unknown", error=str(result)))
+        elif result["success"]:
+            successful.append(result["data"])
+        else:
+            failed.append(result["error"])
+    
+    # Cleanup temp files
+    print(f"🧹 Cleaning up {len(temp_files)} temp files...")
+    await cleanup_temp_files(temp_files)
+    print(f"✅ Cleanup complete")
+    
+    print(f"\n{'='*60}")
+    print(f"📊 BATCH UPLOAD SUMMARY")
+    print(f"   Total Processed: {len(results)}")
+    print(f"   ✅ Successful: {len(successful)}")
+    print(f"   ❌ Failed: {len(failed)}")
+    print(f"   ⏱️  Elapsed: {time.perf_counter() - started:.1f}s")
+    print(f"{'='*60}\n")
+    
+    return BulkUploadResponse(
+        successful=successful,
+        failed=failed,
+        total_processed=len(results),
+        total_successful=len(successful),
+        total_failed=len(failed),
+        elapsed_seconds=round(time.perf_counter() - started, 3)
+    )
+
+
+@router.post("/assignments/upload-multiple", response_model=BulkUploadResponse, response_model_exclude_unset=True)
 async def upload_multiple_assignments(
     files: List[UploadFile] = File(..., description="Upload multiple files"),
     titles: List[str] = Query(..., description="Titles for each file (add multiple times)"),
     teacher_ids: List[str] = Query(..., description="Teacher IDs for each file (add multiple times)"),
-    subjects: List[Optional[str]] = Query(None, description="Subjects for each file (optional, add multiple times)")
+    subjects: List[Optional[str]] = Query(None, description="Subjects for each file (optional, add multiple times)"),
+    async_mode: bool = Query(False, description="Queue the files for the ingest worker and return 202 right away"),
+    verify: bool = Query(False, description="Re-read each saved assignment from the remote API and compare its text"),
+    response_mode: Literal["summary", "pages", "full"] = Query("summary", description="summary: ids, page counts and lengths; pages: plus page contents; full: plus full text"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description="Retries with the same key return the original result instead of re-processing")
 ):
     """
     Upload multiple assignments at once with OCR on every page.
+    Files are processed concurrently; results keep the input order and carry
+    per-stage timings (seconds).
+
+    With async_mode=true the files are only staged in S3 and queued; the
+    response is 202 with job ids to poll at /assignments/jobs/{job_id}.
+
+    With an Idempotency-Key header, a retry of the same request returns the
+    original response (waiting for it if it is still running), and a retry
+    after a crash only re-processes the files that hadn't succeeded.
     """
+    idempotent = None
     try:
         # Validate input
         if len(titles) != len(files):
@@ -50,196 +141,312 @@ async def upload_multiple_assignments(
                 detail=f"Number of subjects ({len(subjects)}) must match number of files ({len(files)})"
             )
         
-        successful = []
-        failed = []
+        if idempotency_key and db_service.database is not None:
+            fingerprint = upload_fingerprint(files, titles, teacher_ids, subjects, async_mode, verify, response_mode)
+            try:
+                idempotent, replay = await begin_idempotent_upload(idempotency_key, fingerprint)
+            except IdempotencyConflictError as e:
+                raise HTTPException(status_code=e.status_code, detail=str(e))
+            if replay:
+                return JSONResponse(status_code=replay["status_code"], content=replay["body"])
+
+        if async_mode:
+            batch = await enqueue_uploads(files, titles, teacher_ids, subjects, verify=verify)
+            print(f"📥 Queued {sum(1 for f in batch['files'] if f['status'] == 'queued')}/{len(files)} files as ingest job {batch['job_id']}")
+            if idempotent:
+                await idempotent.complete(202, batch)
+            return JSONResponse(status_code=202, content=jsonable_encoder(batch))
+
         temp_files = []
-        
-        # Process each file
+
+        # Files run concurrently, at most UPLOAD_FILE_CONCURRENCY from this
+        # request (and UPLOAD_GLOBAL_CONCURRENCY across all requests) at a time
+        request_limit = asyncio.Semaphore(max(1, settings.UPLOAD_FILE_CONCURRENCY))
+        started = time.perf_counter()
+
         async def process_single_file(file: UploadFile, title: str, teacher_id: str, subject: Optional[str], index: int):
-            temp_path = None
-            try:
-                assignment_id = str(uuid.uuid4())
-                
-                print(f"\n{'='*60}")
-                print(f"📤 [{index+1}/{len(files)}] Processing: {file.filename}")
-                print(f"   Title: {title}")
-                print(f"   Subject: {subject}")
-                print(f"   Teacher ID: {teacher_id}")
-                print(f"{'='*60}")
-                
-                # Save temp file
-                temp_path = await process_uploaded_file(file, assignment_id)
-                temp_files.append(temp_path)
-                print(f"✅ Temp file saved: {temp_path}")
-                
-                # Upload to S3
-                s3_url = await upload_to_s3(temp_path, assignment_id, file.filename)
-                print(f"✅ Uploaded to S3: {s3_url}")
-                
-                # Extract text with OCR - THIS IS THE CRITICAL PART
-                print(f"🔍 Starting OCR extraction...")
-                pages_data = await extract_text_from_file(temp_path)
-                
-                # Verify OCR results
-                if not pages_data or len(pages_data) == 0:
-                    raise Exception(f"OCR failed - no pages extracted from {file.filename}")
-                
-                print(f"✅ OCR Complete! Extracted {len(pages_data)} pages:")
-                for page in pages_data:
-                    print(f"   📄 Page {page['page_number']}: {len(page['content'])} chars, method: {page['extraction_method']}")
-                
-                # Create assignment data
-                assignment_data = {
-                    "id": assignment_id,
-                    "title": title,
-                    "subject": subject,
-                    "teacher_id": teacher_id,
-                    "file_url": s3_url,
-                    "file_name": file.filename,
-                    "file_type": file.content_type,
-                    "pages": pages_data,  # CRITICAL: Must have OCR data
-                    "total_pages": len(pages_data),
-                    "full_text": " ".join([page["content"] for page in pages_data]),
-                    "upload_date": datetime.utcnow(),
-                    "status": "processed"
-                }
-                
-                # Verify full_text is not empty
-                if not assignment_data["full_text"].strip():
-                    print(f"⚠️  WARNING: full_text is empty for {file.filename}")
-                else:
-                    print(f"✅ full_text length BEFORE save: {len(assignment_data['full_text'])} chars")
-                
-                # Save to database
-                print(f"💾 Saving to MongoDB...")
-                await save_assignment(assignment_data)
-                print(f"✅ Saved to MongoDB successfully")
-                
-                # DEBUG: Immediate verification after save
-                print(f"\n{'='*60}")
-                print(f"🔍 IMMEDIATE VERIFICATION CHECK")
-                print(f"{'='*60}")
-                
-                saved = await get_assignment_by_id(assignment_id)
-                
-                if saved:
-                    saved_full_text_length = len(saved.get('full_text', ''))
-                    is_chunked = saved.get('is_chunked', False)
-                    original_length = saved.get('original_text_length', 0)
-                    
-                    print(f"✅ Assignment retrieved from DB")
-                    print(f"   Assignment ID: {assignment_id}")
-                    print(f"   Retrieved full_text length: {saved_full_text_length} chars")
-                    print(f"   Is chunked: {is_chunked}")
-                    print(f"   Original length (metadata): {original_length} chars")
-                    print(f"   Expected length: {len(assignment_data['full_text'])} chars")
-                    
-                    # Check for data loss
-                    if saved_full_text_length < len(assignment_data['full_text']) and not is_chunked:
-                        print(f"\n   ⚠️⚠️⚠️  DATA LOSS DETECTED! ⚠️⚠️⚠️")
-                        print(f"   Lost: {len(assignment_data['full_text']) - saved_full_text_length} chars")
-                        print(f"   This is {((len(assignment_data['full_text']) - saved_full_text_length) / len(assignment_data['full_text']) * 100):.1f}% data loss!")
-                    elif is_chunked:
-                        # For chunked data, verify chunks
-                        chunks = saved.get('full_text_chunks', [])
-                        total_chunks_length = sum(len(chunk) for chunk in chunks)
-                        print(f"   Total chunks: {len(chunks)}")
-                        print(f"   Total chunks length: {total_chunks_length} chars")
-                        
-                        if total_chunks_length == len(assignment_data['full_text']):
-                            print(f"   ✅ All content saved successfully in chunks!")
-                        else:
-                            print(f"   ⚠️  Chunk length mismatch!")
-                    else:
-                        print(f"   ✅ Full content saved successfully (no chunking needed)!")
-                    
-                    # Show preview
-                    print(f"\n   📝 Content Preview:")
-                    print(f"   First 200 chars: {saved.get('full_text', '')[:200]}")
-                    print(f"   Last 200 chars: {saved.get('full_text', '')[-200:]}")
-                    
-                else:
-                    print(f"   ❌ ERROR: Could not retrieve saved assignment from DB!")
-                
-                print(f"{'='*60}\n")
-                
-                # Create response with FULL TEXT included
-                response = AssignmentResponse(
-                    id=assignment_id,
-                    title=title,
-                    subject=subject,
-                    teacher_id=teacher_id,
-                    file_url=s3_url,
-                    total_pages=len(pages_data),
-                    upload_date=assignment_data["upload_date"],
-                    status="processed"
-                )
-                
-                # Add full_text to response (convert to dict and add)
-                response_dict = response.dict()
-                response_dict["full_text"] = assignment_data["full_text"]
-                response_dict["full_text_length"] = len(assignment_data["full_text"])
-                response_dict["pages"] = pages_data
-                
-                print(f"✅ [{index+1}/{len(files)}] SUCCESS: {file.filename}\n")
-                
-                return {
-                    "success": True,
-                    "data": response_dict
-                }
-                
-            except Exception as e:
-                print(f"❌ [{index+1}/{len(files)}] FAILED: {file.filename}")
-                print(f"   Error: {str(e)}\n")
-                return {
-                    "success": False,
-                    "error": FailedUpload(
-                        file_name=file.filename,
-                        error=str(e)
-                    )
-                }
-        
-        # Process files SEQUENTIALLY (not concurrent) to avoid issues
-        print(f"\n🚀 Starting batch upload of {len(files)} files...")
-        results = []
-        for idx, (file, title, teacher_id, subject) in enumerate(zip(files, titles, teacher_ids, subjects)):
-            result = await process_single_file(file, title, teacher_id, subject, idx)
-            results.append(result)
-        
-        # Separate successful uploads from failures
-        for result in results:
-            if isinstance(result, Exception):
-                failed.append(FailedUpload(file_name="unknown", error=str(result)))
-            elif result["success"]:
-                successful.append(result["data"])
-            else:
-                failed.append(result["error"])
-        
-        # Cleanup temp files
-        print(f"🧹 Cleaning up {len(temp_files)} temp files...")
-        await cleanup_temp_files(temp_files)
-        print(f"✅ Cleanup complete")
-        
-        print(f"\n{'='*60}")
-        print(f"📊 BATCH UPLOAD SUMMARY")
-        print(f"   Total Processed: {len(files)}")
-        print(f"   ✅ Successful: {len(successful)}")
-        print(f"   ❌ Failed: {len(failed)}")
-        print(f"{'='*60}\n")
+            previous = idempotent.previous_result(index) if idempotent else None
+            if previous:
+                print(f"♻️ [{index+1}/{len(files)}] {file.filename} already processed by an earlier attempt")
+                return previous
+
+            result = await ingest_upload(file, title, teacher_id, subject, f"{index+1}/{len(files)}", temp_files, request_limit, verify)
+            if result["success"]:
+                result["data"] = _apply_response_mode(result["data"], response_mode)
+            if idempotent:
+                await idempotent.save_result(index, result)
+            return result
+
+        print(f"\n🚀 Starting batch upload of {len(files)} files (concurrency: {settings.UPLOAD_FILE_CONCURRENCY})...")
+        # gather() returns results in input order
+        results = await asyncio.gather(*[
+            process_single_file(file, title, teacher_id, subject, idx)
+            for idx, (file, title, teacher_id, subject) in enumerate(zip(files, titles, teacher_ids, subjects))
+        ], return_exceptions=True)
         
-        return BulkUploadResponse(
-            successful=successful,
-            failed=failed,
-            total_processed=len(files),
-            total_successful=len(successful),
-            total_failed=len(failed)
-        )
+        response = await _bulk_upload_response(results, temp_files, started)
+        if idempotent:
+            await idempotent.complete(200, response.model_dump(exclude_unset=True))
+        return response
         
     except HTTPException:
         raise
     except Exception as e:
         print(f"❌ CRITICAL ERROR in bulk upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Bulk upload failed: {str(e)}")
+    finally:
+        # No-op once completed; otherwise lets a retry take over straight away
+        if idempotent:
+            await idempotent.release()
+
+
+@router.post("/assignments/upload-zip", response_model=BulkUploadResponse, response_model_exclude_unset=True)
+async def upload_zip_assignments(
+    archive: UploadFile = File(..., description="ZIP archive of assignment files"),
+    manifest: UploadFile = File(..., description="CSV or JSON manifest: file, title, teacher_id, subject (optional)"),
+    verify: bool = Query(False, description="Re-read each saved assignment from the remote API and compare its text"),
+    response_mode: Literal["summary", "pages", "full"] = Query("summary", description="summary: ids, page counts and lengths; pages: plus page contents; full: plus full text")
+):
+    """
+    Upload a folder of assignments as one ZIP plus a manifest. Members are read
+    straight out of the archive (nothing is extracted to disk) and run through
+    the same per-file pipeline as upload-multiple, concurrently.
+    Archive entries that are not in the manifest are ignored.
+    """
+    try:
+        try:
+            entries = parse_upload_manifest(await manifest.read(), manifest.filename or "")
+        except (ValueError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid manifest: {str(e)}")
+
+        try:
+            # The upload is already spooled by the server; ZipFile reads it in place
+            zf = zipfile.ZipFile(archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="archive is not a valid ZIP file")
+
+        with zf:
+            members = {info.filename.lstrip("/"): info for info in zf.infolist() if not info.is_dir()}
+            temp_files = []
+            request_limit = asyncio.Semaphore(max(1, settings.UPLOAD_FILE_CONCURRENCY))
+            started = time.perf_counter()
+
+            async def process_member(entry: dict, index: int):
+                label = f"{index+1}/{len(entries)}"
+                info = members.get(entry["file"])
+                if info is None:
+                    print(f"❌ [{label}] {entry['file']} is not in the archive")
+                    return {
+                        "success": False,
+                        "error": FailedUpload(file_name=entry["file"], error="File not found in archive")
+                    }
+
+                member = ZipMemberUpload(zf, info, get_content_type(os.path.splitext(info.filename)[1]))
+                result = await ingest_upload(
+                    member, entry["title"], entry["teacher_id"], entry["subject"], label, temp_files, request_limit, verify
+                )
+                if result["success"]:
+                    result["data"] = _apply_response_mode(result["data"], response_mode)
+                return result
+
+            print(f"\n🚀 Starting ZIP upload of {len(entries)} files (concurrency: {settings.UPLOAD_FILE_CONCURRENCY})...")
+            # gather() returns results in manifest order
+            results = await asyncio.gather(*[
+                process_member(entry, idx) for idx, entry in enumerate(entries)
+            ], return_exceptions=True)
+
+        return await _bulk_upload_response(results, temp_files, started)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ CRITICAL ERROR in ZIP upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"ZIP upload failed: {str(e)}")
+
+
+# ─────────────────────────────────────────────
+# RESUMABLE UPLOADS (offset-based)
+#   POST  /assignments/uploads            -> upload_id
+#   PATCH /assignments/uploads/{id}       body = next bytes, Upload-Offset header
+#   GET   /assignments/uploads/{id}       -> received offset / status
+# Once every byte has arrived the file is queued for the ingest worker.
+# Sessions untouched for UPLOAD_SESSION_TTL_SECONDS expire (TTL index) and
+# their staged files are removed by sweep_abandoned_uploads.
+# ─────────────────────────────────────────────
+
+# Serializes PATCHes to the same upload within this process; across processes
+# the conditional offset update in update_upload_session decides who wins.
+# Entries are dropped when an upload completes, fails or expires.
+_upload_locks = {}
+
+
+def _forget_upload_lock(upload_id: str):
+    lock = _upload_locks.get(upload_id)
+    if lock is not None and not lock.locked():
+        del _upload_locks[upload_id]
+
+
+async def sweep_abandoned_uploads():
+    """
+    Runs for the app's lifetime: every UPLOAD_SWEEP_INTERVAL_SECONDS, delete
+    staged files of uploads nobody has written to for UPLOAD_SESSION_TTL_SECONDS
+    and drop their locks
+    """
+    while True:
+        removed = await asyncio.to_thread(sweep_stale_staged_uploads, settings.UPLOAD_SESSION_TTL_SECONDS)
+        for upload_id in removed:
+            _forget_upload_lock(upload_id)
+        if removed:
+            print(f"🧹 Removed {len(removed)} abandoned staged uploads")
+        await asyncio.sleep(settings.UPLOAD_SWEEP_INTERVAL_SECONDS)
+
+
+def _describe_upload(session: dict) -> dict:
+    return {
+        "upload_id": session["_id"],
+        "file_name": session["file_name"],
+        "size": session["size"],
+        "offset": session["offset"],
+        "status": session["status"],
+        "job_id": session.get("job_id"),
+        "assignment_id": session.get("assignment_id"),
+        "error": session.get("error")
+    }
+
+
+async def _get_upload_session_or_404(upload_id: str) -> dict:
+    if db_service.database is None:
+        raise HTTPException(status_code=503, detail="Resumable uploads need the database")
+    session = await db_service.get_upload_session(upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+@router.post("/assignments/uploads", status_code=201)
+async def create_resumable_upload(request: ResumableUploadCreate):
+    """
+    Start a resumable upload. Send the file with PATCH requests, each carrying
+    the next bytes and an Upload-Offset header equal to the bytes received so far.
+    """
+    if db_service.database is None:
+        raise HTTPException(status_code=503, detail="Resumable uploads need the database")
+    if request.size <= 0 or request.size > settings.MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail=f"size must be between 1 and {settings.MAX_FILE_SIZE} bytes")
+
+    session = {"_id": str(uuid.uuid4()), **request.model_dump()}
+    await db_service.create_upload_session(session)
+    print(f"📦 Resumable upload {session['_id']} started: {request.file_name} ({request.size} bytes)")
+    return _describe_upload(session)
+
+
+@router.get("/assignments/uploads/{upload_id}")
+async def get_resumable_upload(upload_id: str):
+    """Bytes received so far (resume from this offset) and processing status"""
+    return _describe_upload(await _get_upload_session_or_404(upload_id))
+
+
+@router.patch("/assignments/uploads/{upload_id}")
+async def append_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset")
+):
+    """
+    Append the request body at Upload-Offset. A mismatched offset gets 409 with
+    the current offset; an interrupted chunk keeps whatever bytes arrived.
+    """
+    lock = _upload_locks.setdefault(upload_id, asyncio.Lock())
+    async with lock:
+        try:
+            session = await _get_upload_session_or_404(upload_id)
+        except HTTPException:
+            # Expired (or never existed): nothing left to serialize
+            _upload_locks.pop(upload_id, None)
+            raise
+        if session["status"] not in ("uploading", "uploaded"):
+            _upload_locks.pop(upload_id, None)
+            return _describe_upload(session)
+        if upload_offset != session["offset"]:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Upload-Offset does not match", "offset": session["offset"]}
+            )
+
+        staged = StagedUpload(upload_id, session["offset"], session["size"])
+        on_disk = staged.bytes_on_disk()
+        if on_disk < session["offset"]:
+            # The staged bytes aren't on this node (another replica, a restarted
+            # container, a cleaned temp dir); rewind to what is actually here
+            print(f"⚠️ Upload {upload_id} has {on_disk}/{session['offset']} bytes staged here - rewinding")
+            await db_service.update_upload_session(upload_id, {"offset": on_disk}, expected_offset=session["offset"])
+            session = await _get_upload_session_or_404(upload_id)
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Staged bytes are missing, resume from offset", "offset": session["offset"]}
+            )
+
+        updated = False
+        try:
+            await staged.append(request.stream())
+        except FileTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            # Client went away mid-chunk; keep what arrived so it can resume
+            print(f"⚠️ Upload {upload_id} interrupted at {staged.offset}/{staged.size} bytes: {e}")
+        finally:
+            updated = await db_service.update_upload_session(upload_id, {"offset": staged.offset}, expected_offset=session["offset"])
+        if not updated:
+            # Another request moved the offset while this one was writing
+            session = await _get_upload_session_or_404(upload_id)
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Upload-Offset does not match", "offset": session["offset"]}
+            )
+        session["offset"] = staged.offset
+
+        if staged.offset < staged.size:
+            return _describe_upload(session)
+
+        # Complete: hand the file to the ingest worker
+        try:
+            job = await enqueue_staged_file(
+                staged.path,
+                file_name=session["file_name"],
+                content_type=session.get("content_type"),
+                title=session["title"],
+                teacher_id=session["teacher_id"],
+                subject=session.get("subject"),
+                verify=session.get("verify", False)
+            )
+        except Exception as e:
+            # Bytes stay staged; an empty PATCH at the final offset retries this
+            print(f"❌ Upload {upload_id} could not be queued: {e}")
+            session.update(status="uploaded", error=str(e))
+            await db_service.update_upload_session(upload_id, {"status": "uploaded", "error": str(e)})
+            _upload_locks.pop(upload_id, None)
+            return _describe_upload(session)
+
+        cleanup_temp_file(staged.path)
+        session.update(status="queued", job_id=job["_id"], assignment_id=job["assignment_id"], error=None)
+        await db_service.update_upload_session(
+            upload_id, {"status": "queued", "job_id": job["_id"], "assignment_id": job["assignment_id"], "error": None}
+        )
+        _upload_locks.pop(upload_id, None)
+        print(f"✅ Upload {upload_id} complete - queued as ingest job {job['_id']}")
+        return _describe_upload(session)
+
+
+@router.get("/assignments/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """
+    Progress of an async upload: a batch job id lists every file, a file job
+    id returns just that file. Each file includes its OCR page progress.
+    """
+    status = await get_ingest_status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return status
 
 
 @router.get("/assignments", response_model=AssignmentList)
@@ -276,6 +483,30 @@ async def get_assignment(assignment_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/assignments/{assignment_id}/refresh")
+async def refresh_assignment(assignment_id: str):
+    """
+    Drop the cached copy of an assignment (e.g. after it was edited on the
+    remote API) and load it again
+    """
+    try:
+        await invalidate_assignment_cache(assignment_id)
+        assignment = await get_assignment_by_id(assignment_id)
+        if not assignment:
+            raise HTTPException(status_code=404, detail="Assignment not found")
+
+        return {
+            "assignment_id": assignment_id,
+            "title": assignment.get("title"),
+            "full_text_length": len(assignment.get("full_text", "")),
+            "refreshed": True
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/assignments/{assignment_id}/full-text")
 async def get_assignment_full_text_endpoint(assignment_id: str):
     """
@@ -300,6 +531,17 @@ async def get_assignment_full_text_endpoint(assignment_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/assignments/{assignment_id}/ocr-job")
+async def get_assignment_ocr_job(assignment_id: str):
+    """
+    Get progress of the (resumable) OCR job for an assignment
+    """
+    progress = await get_ocr_job_progress(assignment_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="No OCR job found for this assignment")
+    return progress
+
+
 @router.get("/assignments/{assignment_id}/pages")
 async def get_assignment_pages(assignment_id: str):
     """
@@ -1,8 +1,9 @@
 
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from typing import Literal, Optional
+from app.config import settings
 from app.services.db_service import get_assignment_by_id, save_video_links, get_video_links
 from app.services.chatbot_service import (
     answer_question,
@@ -11,6 +12,7 @@ from app.services.chatbot_service import (
     generate_search_query,
     clear_conversation,
     get_conversation_history,
+    get_conversation_page,
     get_greeting_response,
     handle_ai_response,
     handle_user_continuation
@@ -182,23 +184,43 @@ async def clear_chat_history(student_id: str, assignment_id: str):
 # ─────────────────────────────────────────────
 
 @router.get("/chatbot/history/{student_id}/{assignment_id}")
-async def get_chat_history(student_id: str, assignment_id: str):
+async def get_chat_history(
+    student_id: str,
+    assignment_id: str,
+    limit: Optional[int] = Query(None, ge=1, description="Messages per page (default CHAT_HISTORY_WINDOW)"),
+    before: Optional[str] = Query(None, description="next_cursor from the previous page, for older messages")
+):
+    """
+    Conversation history, newest page first. Each page is in chronological
+    order; pass its next_cursor as `before` to load the messages before it.
+    """
     try:
-        history = await get_conversation_history(student_id, assignment_id)
+        limit = min(limit or settings.CHAT_HISTORY_WINDOW, settings.CHAT_HISTORY_PAGE_MAX)
+        try:
+            page = await get_conversation_page(student_id, assignment_id, limit, before)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid history cursor")
+        history = page["messages"]
 
         formatted_history = []
         for msg in history:
             formatted_history.append({
                 "role": msg["role"],
                 "message": msg["content"][:200] + "..." if len(msg["content"]) > 200 else msg["content"],
-                "full_message": msg["content"]
+                "full_message": msg["content"],
+                "interaction_type": msg.get("interaction_type"),
+                "created_at": msg["created_at"].isoformat() if msg.get("created_at") else None
             })
 
         return {
             "student_id": student_id,
             "assignment_id": assignment_id,
             "total_messages": len(history),
-            "conversation": formatted_history
+            "conversation": formatted_history,
+            "next_cursor": page["next_cursor"],
+            "has_more": page["next_cursor"] is not None
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
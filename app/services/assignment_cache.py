@@ -0,0 +1,95 @@
+# Read-through cache for composed assignments (remote record + OCR text +
+# full_text), used by db_service.get_assignment_by_id.
+#
+# Tier 1 is an in-process LRU bounded by total bytes and a TTL. Tier 2 is an
+# optional Mongo collection (ASSIGNMENT_CACHE_SHARED) so other replicas and the
+# ingest worker reuse the same entries. Invalidation drops both tiers in this
+# process; other processes' tier 1 copies expire with the TTL.
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.config import settings
+
+
+class AssignmentCache:
+    def __init__(self, max_bytes: int, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # assignment_id -> (expires_at, size, payload)
+        self._bytes = 0
+        self.stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _drop(self, assignment_id: str):
+        entry = self._entries.pop(assignment_id, None)
+        if entry:
+            self._bytes -= entry[1]
+
+    def _store_local(self, assignment_id: str, payload: str, expires_at: float):
+        size = len(payload)
+        self._drop(assignment_id)
+        if size > self.max_bytes:
+            return
+        self._entries[assignment_id] = (expires_at, size, payload)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.stats['evictions'] += 1
+
+    async def get(self, assignment_id: str, collection=None) -> Optional[dict]:
+        """A fresh copy of the cached assignment, or None"""
+        entry = self._entries.get(assignment_id)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(assignment_id)
+            self.stats['hits'] += 1
+            return json.loads(entry[2])
+        if entry:
+            self._drop(assignment_id)
+
+        if collection is not None:
+            try:
+                doc = await collection.find_one({"_id": assignment_id, "expires_at": {"$gt": datetime.utcnow()}})
+                if doc:
+                    remaining = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+                    self._store_local(assignment_id, doc["payload"], time.monotonic() + remaining)
+                    self.stats['shared_hits'] += 1
+                    return json.loads(doc["payload"])
+            except Exception as e:
+                print(f"❌ Assignment cache read error: {e}")
+
+        self.stats['misses'] += 1
+        return None
+
+    async def set(self, assignment_id: str, assignment: dict, collection=None):
+        payload = json.dumps(assignment, default=str)
+        self._store_local(assignment_id, payload, time.monotonic() + self.ttl_seconds)
+
+        if collection is not None:
+            try:
+                await collection.update_one(
+                    {"_id": assignment_id},
+                    {"$set": {
+                        "payload": payload,
+                        "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+                    }},
+                    upsert=True
+                )
+            except Exception as e:
+                print(f"❌ Assignment cache save error: {e}")
+
+    async def invalidate(self, assignment_id: str, collection=None):
+        self._drop(assignment_id)
+        if collection is not None:
+            try:
+                await collection.delete_one({"_id": assignment_id})
+            except Exception as e:
+                print(f"❌ Assignment cache invalidate error: {e}")
+
+    def get_stats(self) -> dict:
+        return {**self.stats, 'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+
+assignment_cache = AssignmentCache(settings.ASSIGNMENT_CACHE_MAX_BYTES, settings.ASSIGNMENT_CACHE_TTL_SECONDS)
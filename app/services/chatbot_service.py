@@ -3,35 +3,32 @@ from app.config import settings
 from typing import List, Dict, Optional
 import re
 from datetime import datetime
+from bson import ObjectId
 from app.services import db_service
 
 client = OpenAI(api_key=settings.OPENAI_API_KEY)
 
 
-async def get_conversation_history(student_id: str, assignment_id: str) -> List[Dict]:
-    """Get conversation history for a student-assignment pair from database"""
+async def get_conversation_history(student_id: str, assignment_id: str, limit: Optional[int] = None) -> List[Dict]:
+    """
+    Last settings.CHAT_HISTORY_WINDOW (or limit) messages of a student-assignment
+    conversation, oldest first, as {"role", "content"} dicts for the model
+    """
     try:
         if db_service.database is None:
             return []
         
         chat_collection = db_service.database.get_collection('chat_messages')
+        limit = limit or settings.CHAT_HISTORY_WINDOW
         
-        messages = await chat_collection.find({
-            "student_id": student_id,
-            "assignment_id": assignment_id
-        }).to_list(length=None)
-        
-        # Sort by creation time
-        messages = sorted(messages, key=lambda x: x.get('created_at', datetime.utcnow()))
-        
-        # Keep only last 20 messages
-        if len(messages) > 20:
-            messages = messages[-20:]
-        
-        # Remove MongoDB _id field
-        for msg in messages:
-            msg.pop('_id', None)
-            msg.pop('created_at', None)
+        # Newest first so the server can stop after `limit` (uses the
+        # student_id + assignment_id + created_at index), then flip back
+        cursor = chat_collection.find(
+            {"student_id": student_id, "assignment_id": assignment_id},
+            {"_id": 0, "role": 1, "content": 1}
+        ).sort([("created_at", -1), ("_id", -1)]).limit(limit)
+        messages = await cursor.to_list(length=limit)
+        messages.reverse()
         
         return messages
         
@@ -40,6 +37,57 @@ async def get_conversation_history(student_id: str, assignment_id: str) -> List[
         return []
 
 
+def _encode_history_cursor(message: dict) -> str:
+    return f"{message['created_at'].isoformat()}_{message['_id']}"
+
+
+def _decode_history_cursor(cursor: str) -> tuple:
+    """(created_at, _id) of the message a page ended at; ValueError if malformed"""
+    created_at, _, message_id = cursor.partition("_")
+    if not ObjectId.is_valid(message_id):
+        raise ValueError("invalid cursor")
+    return datetime.fromisoformat(created_at), ObjectId(message_id)
+
+
+async def get_conversation_page(
+    student_id: str,
+    assignment_id: str,
+    limit: int,
+    before: Optional[str] = None
+) -> Dict:
+    """
+    One page of a conversation, walking back in time: the newest `limit`
+    messages older than the `before` cursor (the newest ones when omitted),
+    oldest first. next_cursor fetches the page before this one; None at the
+    start of the conversation. Raises ValueError for a malformed cursor.
+    """
+    query = {"student_id": student_id, "assignment_id": assignment_id}
+    if before:
+        created_at, message_id = _decode_history_cursor(before)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": message_id}}
+        ]
+
+    if db_service.database is None:
+        return {"messages": [], "next_cursor": None}
+
+    chat_collection = db_service.database.get_collection('chat_messages')
+    # One extra message tells whether there is an older page
+    cursor = chat_collection.find(
+        query,
+        {"role": 1, "content": 1, "interaction_type": 1, "created_at": 1}
+    ).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1)
+    messages = await cursor.to_list(length=limit + 1)
+
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    next_cursor = _encode_history_cursor(messages[-1]) if has_more else None
+    messages.reverse()
+
+    return {"messages": messages, "next_cursor": next_cursor}
+
+
 async def save_conversation(student_id: str, assignment_id: str, role: str, content: str, interaction_type: str = "ai_response"):
     """Save a message to conversation history in database"""
     try:
@@ -0,0 +1,144 @@
+# MongoDB index registry: every index the services rely on, by collection.
+# Applied on app startup (see main.py lifespan) and from the command line:
+#
+#   python -m app.services.db_indexes verify   # report missing / changed indexes
+#   python -m app.services.db_indexes build    # create the missing ones in the background
+#
+# Indexes are matched by key, so one created by hand under another name counts.
+# Keys the services upsert on are unique, so racing upserts can't insert twice.
+import argparse
+import asyncio
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from app.services import db_service
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "assignment_ocr_cache": [
+        IndexModel([("assignment_id", ASCENDING)], name="assignment_id", unique=True),
+    ],
+    "ocr_page_cache": [
+        IndexModel([("content_hash", ASCENDING)], name="content_hash", unique=True),
+    ],
+    "ocr_jobs": [
+        IndexModel([("job_id", ASCENDING)], name="job_id", unique=True),
+        IndexModel([("assignment_ids", ASCENDING), ("updated_at", DESCENDING)], name="assignment_ids_updated_at"),
+    ],
+    "ocr_leases": [
+        # Leases are deleted on release; this only sweeps ones left by dead processes
+        IndexModel([("lease_until", ASCENDING)], name="lease_until_ttl", expireAfterSeconds=3600),
+    ],
+    "ingest_jobs": [
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+        IndexModel([("batch_id", ASCENDING), ("index", ASCENDING)], name="batch_id_index"),
+    ],
+    "upload_sessions": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "upload_idempotency": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "assignment_cache": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "chat_messages": [
+        # _id breaks created_at ties, so history pages sort without a blocking sort
+        IndexModel([("student_id", ASCENDING), ("assignment_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)], name="student_assignment_created_at_id"),
+    ],
+    "video_links": [
+        IndexModel([("student_id", ASCENDING), ("assignment_id", ASCENDING), ("created_at", DESCENDING)], name="student_assignment_created_at"),
+    ],
+    "mindmaps": [
+        IndexModel([("student_id", ASCENDING), ("created_at", DESCENDING)], name="student_created_at"),
+    ],
+}
+
+
+def _key(key) -> tuple:
+    """Index key as a comparable tuple, from a model's SON or index_information()'s list"""
+    items = key.items() if hasattr(key, "items") else key
+    return tuple((field, int(direction)) for field, direction in items)
+
+
+async def verify_indexes() -> dict:
+    """
+    Compare the registry with the database. Returns {collection: {"missing":
+    [names], "mismatched": [names]}} for every collection that isn't in sync;
+    mismatched means the key exists but with different TTL / unique options.
+    """
+    report = {}
+    for collection, models in INDEXES.items():
+        existing = await db_service.database[collection].index_information()
+        by_key = {_key(info["key"]): info for info in existing.values()}
+        missing, mismatched = [], []
+        for model in models:
+            spec = model.document
+            info = by_key.get(_key(spec["key"]))
+            if info is None:
+                missing.append(spec["name"])
+            elif any(info.get(option) != spec.get(option) for option in ("expireAfterSeconds", "unique")):
+                mismatched.append(spec["name"])
+        if missing or mismatched:
+            report[collection] = {"missing": missing, "mismatched": mismatched}
+    return report
+
+
+async def ensure_indexes(background: bool = True) -> dict:
+    """
+    Create every registry index that doesn't exist yet. Never raises; returns
+    {"created": {collection: [names]}, "errors": {collection: message}}.
+    Mismatched options are reported by verify_indexes but not changed here.
+    """
+    created, errors = {}, {}
+    if db_service.database is None:
+        return {"created": created, "errors": errors}
+
+    for collection, models in INDEXES.items():
+        try:
+            col = db_service.database[collection]
+            existing = await col.index_information()
+            keys = {_key(info["key"]) for info in existing.values()}
+            todo = [model for model in models if _key(model.document["key"]) not in keys]
+            if not todo:
+                continue
+            if background:
+                # Per-index option; servers from 4.2 on ignore it (builds no longer block)
+                todo = [IndexModel(list(model.document["key"].items()), background=True,
+                                   **{k: v for k, v in model.document.items() if k != "key"}) for model in todo]
+            created[collection] = await col.create_indexes(todo)
+            print(f"✅ Indexes created on {collection}: {', '.join(created[collection])}")
+        except Exception as e:
+            errors[collection] = str(e)
+            print(f"❌ Index build error on {collection}: {e}")
+
+    return {"created": created, "errors": errors}
+
+
+async def _main(command: str):
+    await db_service.connect_db()
+    try:
+        if command == "build":
+            result = await ensure_indexes(background=True)
+            if not result["created"] and not result["errors"]:
+                print("✅ All indexes already exist")
+            return 1 if result["errors"] else 0
+
+        report = await verify_indexes()
+        for collection, problems in report.items():
+            for name in problems["missing"]:
+                print(f"❌ {collection}.{name} is missing")
+            for name in problems["mismatched"]:
+                print(f"⚠️  {collection}.{name} exists with different options")
+        if not report:
+            print(f"✅ All {sum(len(m) for m in INDEXES.values())} indexes are in place")
+        return 1 if report else 0
+    finally:
+        await db_service.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify or build the MongoDB indexes")
+    parser.add_argument("command", choices=["verify", "build"])
+    raise SystemExit(asyncio.run(_main(parser.parse_args().command)))
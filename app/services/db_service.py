@@ -1,20 +1,32 @@
 
 
+import asyncio
 import httpx
+import importlib.util
 import tempfile
 import os
+import socket
+import time
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from app.config import settings
+from app.services.assignment_cache import assignment_cache
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timedelta
 
 REMOTE_API_BASE = "http://206.162.244.131:5021/api/v1"
-TIMEOUT = 60
 
 # MongoDB client (for chat messages + OCR cache + video links)
 mongodb_client = None
 database = None
 
+# Identifies this process as the holder of OCR leases
+OCR_LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+# Shared HTTP client for the remote API and file downloads (keep-alive pool)
+http_client: Optional[httpx.AsyncClient] = None
+
 
 def _normalize(data: dict) -> dict:
     if data and "_id" in data:
@@ -40,38 +52,515 @@ async def close_db():
         mongodb_client.close()
 
 
+# ─────────────────────────────────────────────
+# HTTP client (remote API + downloads)
+# ─────────────────────────────────────────────
+
+def _timeout(read: float) -> httpx.Timeout:
+    return httpx.Timeout(read, connect=settings.REMOTE_API_CONNECT_TIMEOUT)
+
+
+def open_http_client() -> httpx.AsyncClient:
+    """
+    Create the process-wide pooled client. Called from the app lifespan and
+    the ingest worker; http() also creates it lazily for scripts.
+    """
+    global http_client
+    if http_client is None:
+        http2 = settings.REMOTE_API_HTTP2 and importlib.util.find_spec("h2") is not None
+        http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.REMOTE_API_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.REMOTE_API_MAX_KEEPALIVE,
+                keepalive_expiry=settings.REMOTE_API_KEEPALIVE_EXPIRY
+            ),
+            timeout=_timeout(settings.REMOTE_API_TIMEOUT)
+        )
+        print(f"✅ HTTP client ready (pool: {settings.REMOTE_API_MAX_CONNECTIONS}, http2: {http2})")
+    return http_client
+
+
+def http() -> httpx.AsyncClient:
+    return http_client if http_client is not None else open_http_client()
+
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+
 # ─────────────────────────────────────────────
 # OCR CACHE
 # ─────────────────────────────────────────────
 
-async def _get_cached_ocr(assignment_id: str) -> Optional[str]:
+async def _get_cached_ocr(assignment_id: str) -> Optional[dict]:
+    """
+    Returns {"full_text", "complete", "attempts", "attempted_at"} or None.
+    complete is False while lazy OCR is still filling in the remaining pages or
+    after a pass that left pages failed; attempts counts those passes.
+    """
     try:
         if database is None:
             return None
         col = database["assignment_ocr_cache"]
         doc = await col.find_one({"assignment_id": assignment_id})
         if doc:
-            print(f"✅ OCR Cache HIT for {assignment_id} — skipping OCR")
-            return doc["full_text"]
+            complete = doc.get("complete", True)
+            print(f"✅ OCR Cache HIT for {assignment_id} — skipping OCR{'' if complete else ' (partial)'}")
+            return {
+                "full_text": doc["full_text"],
+                "complete": complete,
+                "attempts": doc.get("attempts", 0),
+                "attempted_at": doc.get("attempted_at")
+            }
         return None
     except Exception as e:
         print(f"❌ Cache read error: {e}")
         return None
 
 
-async def _save_ocr_cache(assignment_id: str, full_text: str):
+async def _save_ocr_cache(assignment_id: str, full_text: Optional[str], complete: bool = True, end_of_pass: bool = True):
+    """
+    Cache an OCR pass's text. An incomplete pass also bumps attempts and
+    attempted_at, which _background_ocr_due uses to space out retries;
+    end_of_pass=False (progress written while a pass runs) doesn't.
+    full_text None keeps the cached text (a retry that got nothing new).
+    """
     try:
         if database is None:
             return
         col = database["assignment_ocr_cache"]
+        now = datetime.utcnow()
+        fields = {"assignment_id": assignment_id, "complete": complete, "updated_at": now}
+        update = {"$set": fields}
+        if full_text is not None:
+            fields["full_text"] = full_text
+        else:
+            update["$setOnInsert"] = {"full_text": ""}
+        if complete:
+            update["$unset"] = {"attempts": "", "attempted_at": ""}
+        elif end_of_pass:
+            fields["attempted_at"] = now
+            update["$inc"] = {"attempts": 1}
+        await col.update_one({"assignment_id": assignment_id}, update, upsert=True)
+        print(f"✅ OCR result cached for {assignment_id}{'' if complete else ' (partial)'}")
+    except Exception as e:
+        print(f"❌ Cache save error: {e}")
+    # The composed assignment embeds this text
+    await invalidate_assignment_cache(assignment_id)
+
+
+async def seed_ocr_cache(assignment_id: str, pages: List[dict]):
+    """
+    Cache the pages extracted at upload time, so the first chat (or
+    get_assignment_by_id) doesn't download and OCR the file again
+    """
+    await _save_ocr_cache(assignment_id, _join_pages(pages))
+
+
+# ─────────────────────────────────────────────
+# OCR PAGE CACHE (content-hash keyed)
+# ─────────────────────────────────────────────
+
+async def get_cached_page_ocr(content_hash: str) -> Optional[str]:
+    """Look up OCR text for a page image / image file by its sha256 (a plain read, no hit counter)"""
+    try:
+        if database is None or not settings.OCR_PAGE_CACHE_ENABLED:
+            return None
+        col = database["ocr_page_cache"]
+        doc = await col.find_one({"content_hash": content_hash}, projection={"text": 1})
+        if doc:
+            print(f"✅ Page OCR Cache HIT for {content_hash[:12]}")
+            return doc["text"]
+        return None
+    except Exception as e:
+        print(f"❌ Page cache read error: {e}")
+        return None
+
+
+async def save_page_ocr_cache(content_hash: str, text: str):
+    try:
+        if database is None or not settings.OCR_PAGE_CACHE_ENABLED:
+            return
+        col = database["ocr_page_cache"]
+        now = datetime.utcnow()
         await col.update_one(
-            {"assignment_id": assignment_id},
-            {"$set": {"assignment_id": assignment_id, "full_text": full_text}},
+            {"content_hash": content_hash},
+            {
+                "$set": {"text": text, "last_used_at": now},
+                "$setOnInsert": {"content_hash": content_hash, "created_at": now}
+            },
             upsert=True
         )
-        print(f"✅ OCR result cached for {assignment_id}")
     except Exception as e:
-        print(f"❌ Cache save error: {e}")
+        print(f"❌ Page cache save error: {e}")
+
+
+# ─────────────────────────────────────────────
+# OCR JOBS (per-page checkpoints for resumable extraction)
+# ─────────────────────────────────────────────
+
+async def start_ocr_job(job_id: str, file_name: str, total_pages: int, assignment_id: Optional[str] = None) -> dict:
+    """
+    Create the job or pick up an existing one. Returns {page_number: page}
+    for every page already checkpointed, so the caller can skip them.
+    """
+    try:
+        if database is None:
+            return {}
+        col = database["ocr_jobs"]
+        now = datetime.utcnow()
+        update = {
+            "$set": {"status": "running", "total_pages": total_pages, "updated_at": now},
+            "$setOnInsert": {"job_id": job_id, "file_name": file_name, "pages": {}, "created_at": now},
+            "$inc": {"attempts": 1}
+        }
+        if assignment_id:
+            update["$addToSet"] = {"assignment_ids": assignment_id}
+        doc = await col.find_one_and_update({"job_id": job_id}, update, upsert=True, return_document=ReturnDocument.AFTER)
+        done = {int(n): page for n, page in (doc.get("pages") or {}).items()}
+        if done:
+            print(f"♻️ OCR job {job_id} resuming - {len(done)}/{total_pages} pages already done (attempt {doc['attempts']})")
+        return done
+    except Exception as e:
+        print(f"❌ OCR job start error: {e}")
+        return {}
+
+
+async def checkpoint_ocr_pages(job_id: str, pages: List[dict]):
+    """Persist finished pages; pages carrying an 'error' are left for the next attempt"""
+    try:
+        if database is None:
+            return
+        done = {f"pages.{p['page_number']}": p for p in pages if not p.get("error")}
+        if not done:
+            return
+        done["updated_at"] = datetime.utcnow()
+        await database["ocr_jobs"].update_one({"job_id": job_id}, {"$set": done})
+    except Exception as e:
+        print(f"❌ OCR checkpoint error: {e}")
+
+
+async def finish_ocr_job(job_id: str, failed_pages: List[int], pending_pages: Optional[List[int]] = None):
+    try:
+        if database is None:
+            return
+        if failed_pages:
+            status = "incomplete"
+        elif pending_pages:
+            status = "partial"
+        else:
+            status = "completed"
+        await database["ocr_jobs"].update_one(
+            {"job_id": job_id},
+            {"$set": {
+                "status": status,
+                "failed_pages": failed_pages,
+                "pending_pages": pending_pages or [],
+                "updated_at": datetime.utcnow()
+            }}
+        )
+    except Exception as e:
+        print(f"❌ OCR job finish error: {e}")
+
+
+async def get_ocr_job_progress(assignment_id: str) -> Optional[dict]:
+    """Latest OCR job that ran for this assignment, summarised as progress"""
+    try:
+        if database is None:
+            return None
+        doc = await database["ocr_jobs"].find_one(
+            {"assignment_ids": assignment_id},
+            sort=[("updated_at", -1)]
+        )
+        if not doc:
+            return None
+        total = doc.get("total_pages") or 0
+        completed = len(doc.get("pages") or {})
+        return {
+            "job_id": doc["job_id"],
+            "status": doc.get("status"),
+            "file_name": doc.get("file_name"),
+            "total_pages": total,
+            "completed_pages": completed,
+            "failed_pages": doc.get("failed_pages", []),
+            "pending_pages": doc.get("pending_pages", []),
+            "percent": round(completed / total * 100, 1) if total else 0.0,
+            "attempts": doc.get("attempts", 1),
+            "updated_at": doc.get("updated_at")
+        }
+    except Exception as e:
+        print(f"❌ OCR job progress error: {e}")
+        return None
+
+
+# ─────────────────────────────────────────────
+# ASSIGNMENT FILES (content-addressed dedupe, keyed by sha256)
+# ─────────────────────────────────────────────
+
+async def get_assignment_file(sha256: str) -> Optional[dict]:
+    """Stored S3 object (and OCR pages, once extracted) for this content, or None"""
+    try:
+        if database is None:
+            return None
+        return await database["assignment_files"].find_one({"_id": sha256})
+    except Exception as e:
+        print(f"❌ Assignment file lookup error: {e}")
+        return None
+
+
+async def register_assignment_file(sha256: str, file_url: str, s3_key: str, file_name: str, size: int):
+    """Record the S3 object for new content; the first upload of a given content wins"""
+    try:
+        if database is None:
+            return
+        now = datetime.utcnow()
+        await database["assignment_files"].update_one(
+            {"_id": sha256},
+            {"$setOnInsert": {
+                "file_url": file_url,
+                "s3_key": s3_key,
+                "file_name": file_name,
+                "size": size,
+                "created_at": now
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"❌ Assignment file register error: {e}")
+
+
+async def save_assignment_file_pages(sha256: str, pages: List[dict]):
+    """Attach fully extracted pages so later uploads of the same content skip OCR"""
+    try:
+        if database is None:
+            return
+        await database["assignment_files"].update_one(
+            {"_id": sha256},
+            {"$set": {"pages": pages, "total_pages": len(pages), "pages_saved_at": datetime.utcnow()}}
+        )
+    except Exception as e:
+        print(f"❌ Assignment file pages save error: {e}")
+
+
+# ─────────────────────────────────────────────
+# INGEST JOBS (async uploads, processed by app.worker)
+# ─────────────────────────────────────────────
+
+async def create_ingest_jobs(jobs: List[dict]):
+    """Queue one job per staged file; each dict must carry its own _id"""
+    now = datetime.utcnow()
+    for job in jobs:
+        job.update({"status": "queued", "attempts": 0, "created_at": now, "updated_at": now})
+    await database["ingest_jobs"].insert_many(jobs)
+
+
+async def claim_ingest_job(worker_id: str, lease_seconds: int) -> Optional[dict]:
+    """
+    Atomically take the oldest queued job, or a running one whose lease ran out
+    (its worker died), and lease it to worker_id. An expired job that already
+    used up INGEST_MAX_ATTEMPTS is marked failed instead, so a job that keeps
+    killing its worker (OOM, SIGKILL) isn't re-leased forever.
+    """
+    col = database["ingest_jobs"]
+    now = datetime.utcnow()
+    await col.update_many(
+        {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$gte": settings.INGEST_MAX_ATTEMPTS}},
+        {"$set": {
+            "status": "failed",
+            "error": "Lease expired on the last attempt (worker died)",
+            "lease_until": None,
+            "updated_at": now
+        }}
+    )
+    return await col.find_one_and_update(
+        {"$or": [
+            {"status": "queued"},
+            {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$lt": settings.INGEST_MAX_ATTEMPTS}}
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "worker_id": worker_id,
+                "lease_until": now + timedelta(seconds=lease_seconds),
+                "started_at": now,
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def renew_ingest_lease(job_id: str, worker_id: str, lease_seconds: int) -> bool:
+    """Extend the lease; False if another worker has taken the job over"""
+    now = datetime.utcnow()
+    result = await database["ingest_jobs"].update_one(
+        {"_id": job_id, "worker_id": worker_id, "status": "running"},
+        {"$set": {"lease_until": now + timedelta(seconds=lease_seconds), "updated_at": now}}
+    )
+    return result.modified_count == 1
+
+
+async def finish_ingest_job(job_id: str, worker_id: str, status: str, **fields):
+    """Set the final (or, with status 'queued', retry) state of a leased job"""
+    fields.update({"status": status, "lease_until": None, "updated_at": datetime.utcnow()})
+    await database["ingest_jobs"].update_one(
+        {"_id": job_id, "worker_id": worker_id},
+        {"$set": fields}
+    )
+
+
+async def get_ingest_jobs(job_id: str) -> List[dict]:
+    """The file job with this id, or every file job of the batch with this id"""
+    try:
+        if database is None:
+            return []
+        col = database["ingest_jobs"]
+        job = await col.find_one({"_id": job_id})
+        if job:
+            return [job]
+        return await col.find({"batch_id": job_id}).sort("index", 1).to_list(length=None)
+    except Exception as e:
+        print(f"❌ Ingest job lookup error: {e}")
+        return []
+
+
+# ─────────────────────────────────────────────
+# UPLOAD IDEMPOTENCY (Idempotency-Key header on upload-multiple)
+# ─────────────────────────────────────────────
+
+async def claim_idempotency_key(key: str, fingerprint: str, owner: str, lease_seconds: int, ttl_seconds: int) -> dict:
+    """
+    Take ownership of an idempotency key. Returns the record with "owned" True
+    if this caller now processes the request: a new key, or one whose previous
+    owner died (lease expired) - then "results" holds the files it finished.
+    Otherwise returns the existing record with "owned" False.
+    """
+    col = database["upload_idempotency"]
+    now = datetime.utcnow()
+    claim = {
+        "owner": owner,
+        "lease_until": now + timedelta(seconds=lease_seconds),
+        "updated_at": now
+    }
+    try:
+        await col.insert_one({
+            "_id": key,
+            "fingerprint": fingerprint,
+            "status": "in_progress",
+            "results": {},
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=ttl_seconds),
+            **claim
+        })
+        return {"_id": key, "fingerprint": fingerprint, "status": "in_progress", "results": {}, "owned": True}
+    except DuplicateKeyError:
+        pass
+
+    doc = await col.find_one_and_update(
+        {"_id": key, "status": "in_progress", "lease_until": {"$lt": now}},
+        {"$set": claim},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc:
+        doc["owned"] = True
+        return doc
+    doc = await col.find_one({"_id": key}) or {"_id": key, "status": "in_progress", "fingerprint": fingerprint}
+    doc["owned"] = False
+    return doc
+
+
+async def get_idempotency_record(key: str) -> Optional[dict]:
+    return await database["upload_idempotency"].find_one({"_id": key})
+
+
+async def save_idempotent_file_result(key: str, owner: str, index: int, result: dict, lease_seconds: int):
+    """Store one finished file's result and extend the owner's lease"""
+    now = datetime.utcnow()
+    await database["upload_idempotency"].update_one(
+        {"_id": key, "owner": owner},
+        {"$set": {
+            f"results.{index}": result,
+            "lease_until": now + timedelta(seconds=lease_seconds),
+            "updated_at": now
+        }}
+    )
+
+
+async def renew_idempotency_lease(key: str, owner: str, lease_seconds: int):
+    now = datetime.utcnow()
+    await database["upload_idempotency"].update_one(
+        {"_id": key, "owner": owner, "status": "in_progress"},
+        {"$set": {"lease_until": now + timedelta(seconds=lease_seconds), "updated_at": now}}
+    )
+
+
+async def complete_idempotency_key(key: str, owner: str, status_code: int, body: dict):
+    await database["upload_idempotency"].update_one(
+        {"_id": key, "owner": owner},
+        {"$set": {
+            "status": "completed",
+            "status_code": status_code,
+            "body": body,
+            "lease_until": None,
+            "updated_at": datetime.utcnow()
+        }}
+    )
+
+
+async def release_idempotency_key(key: str, owner: str):
+    """
+    Drop the lease of a request that failed outright, so a retry takes over
+    at once and only redoes the files that have no stored result
+    """
+    await database["upload_idempotency"].update_one(
+        {"_id": key, "owner": owner, "status": "in_progress"},
+        {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+
+
+# ─────────────────────────────────────────────
+# RESUMABLE UPLOAD SESSIONS
+# ─────────────────────────────────────────────
+
+def _upload_session_expiry(now: datetime) -> datetime:
+    return now + timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS)
+
+
+async def create_upload_session(session: dict):
+    """Store a new session; it expires (TTL index) once nobody touches it for UPLOAD_SESSION_TTL_SECONDS"""
+    now = datetime.utcnow()
+    session.update({
+        "offset": 0,
+        "status": "uploading",
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": _upload_session_expiry(now)
+    })
+    await database["upload_sessions"].insert_one(session)
+
+
+async def get_upload_session(upload_id: str) -> Optional[dict]:
+    return await database["upload_sessions"].find_one({"_id": upload_id})
+
+
+async def update_upload_session(upload_id: str, fields: dict, expected_offset: Optional[int] = None) -> bool:
+    """
+    Update a session and push back its expiry; with expected_offset only if
+    nobody moved its offset meanwhile
+    """
+    query = {"_id": upload_id}
+    if expected_offset is not None:
+        query["offset"] = expected_offset
+    now = datetime.utcnow()
+    fields.update({"updated_at": now, "expires_at": _upload_session_expiry(now)})
+    result = await database["upload_sessions"].update_one(query, {"$set": fields})
+    return result.matched_count == 1
 
 
 # ─────────────────────────────────────────────
@@ -123,35 +612,284 @@ async def get_video_links(
 
 
 # ─────────────────────────────────────────────
-# HELPER: Download PDF and OCR it
+# OCR LEASES (one process OCRs an assignment at a time)
 # ─────────────────────────────────────────────
 
-async def _extract_text_from_url(file_url: str) -> str:
-    from app.services.ocr_service import extract_text_from_file
+async def claim_ocr_lease(assignment_id: str, lease_seconds: int) -> bool:
+    """
+    Take (or extend) the OCR lease on an assignment. Re-entrant for this
+    process; fails while another live process holds it. Without MongoDB there
+    is nothing to coordinate with, so the claim always succeeds.
+    """
+    if database is None:
+        return True
+    now = datetime.utcnow()
+    try:
+        await database["ocr_leases"].update_one(
+            {"_id": assignment_id, "$or": [{"owner": OCR_LEASE_OWNER}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"owner": OCR_LEASE_OWNER, "lease_until": now + timedelta(seconds=lease_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+    except Exception as e:
+        print(f"❌ OCR lease claim error: {e}")
+        return True
+
 
+async def release_ocr_lease(assignment_id: str):
     try:
-        print(f"📥 Downloading file from: {file_url}")
-        async with httpx.AsyncClient(timeout=120) as client:
-            response = await client.get(file_url)
-            response.raise_for_status()
+        if database is None:
+            return
+        await database["ocr_leases"].delete_one({"_id": assignment_id, "owner": OCR_LEASE_OWNER})
+    except Exception as e:
+        print(f"❌ OCR lease release error: {e}")
+
+
+async def _renew_ocr_lease(assignment_id: str):
+    interval = max(1, settings.OCR_LEASE_SECONDS // 3)
+    while True:
+        await asyncio.sleep(interval)
+        await claim_ocr_lease(assignment_id, settings.OCR_LEASE_SECONDS)
+
+
+# ─────────────────────────────────────────────
+# HELPER: Download PDF and OCR it
+# ─────────────────────────────────────────────
+
+async def _download_to_temp(file_url: str) -> str:
+    print(f"📥 Downloading file from: {file_url}")
+    ext = os.path.splitext(file_url.split("?")[0])[1].lower() or ".pdf"
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
+        tmp_path = tmp.name
+        try:
+            async with http().stream("GET", file_url, timeout=_timeout(settings.REMOTE_API_DOWNLOAD_TIMEOUT)) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(settings.UPLOAD_CHUNK_SIZE):
+                    tmp.write(chunk)
+        except Exception:
+            tmp.close()
+            os.unlink(tmp_path)
+            raise
+
+    print(f"✅ File downloaded to temp: {tmp_path}")
+    return tmp_path
 
-        ext = os.path.splitext(file_url.split("?")[0])[1].lower() or ".pdf"
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            tmp.write(response.content)
-            tmp_path = tmp.name
+def _join_pages(pages: list) -> str:
+    """Full text from the pages that actually have content (skips failed / pending ones)"""
+    text = "\n\n".join([p["content"] for p in pages if not p.get("error") and p["extraction_method"] != "pending"])
+    pending = [p["page_number"] for p in pages if p["extraction_method"] == "pending"]
+    if pending:
+        text += f"\n\n[{len(pending)} more pages are still being processed and will be available shortly]"
+    return text
 
-        print(f"✅ File downloaded to temp: {tmp_path}")
-        pages = await extract_text_from_file(tmp_path)
-        os.unlink(tmp_path)
 
-        full_text = "\n\n".join([p["content"] for p in pages])
+async def _extract_text_from_url(
+    file_url: str,
+    assignment_id: Optional[str] = None,
+    ocr_page_numbers: Optional[set] = None,
+    tmp_path: Optional[str] = None,
+    on_progress=None
+) -> tuple:
+    """
+    Returns (full_text, complete, tmp_path). complete is False when the
+    download failed, some pages failed OCR, or pages were left pending by
+    ocr_page_numbers - those results must not be cached as final, so the next
+    pass resumes the OCR job instead. tmp_path is only returned (and kept on
+    disk) when pages are still pending; otherwise the file is removed.
+    on_progress is passed on to extract_text_from_file.
+    """
+    from app.services.ocr_service import extract_text_from_file
+
+    try:
+        if tmp_path is None:
+            tmp_path = await _download_to_temp(file_url)
+
+        job_id = f"assignment:{assignment_id}" if assignment_id else None
+        pages = await extract_text_from_file(
+            tmp_path,
+            job_id=job_id,
+            assignment_id=assignment_id,
+            ocr_page_numbers=ocr_page_numbers,
+            on_progress=on_progress
+        )
+
+        failed_pages = [p["page_number"] for p in pages if p.get("error")]
+        has_pending = any(p["extraction_method"] == "pending" for p in pages)
+        full_text = _join_pages(pages)
         print(f"✅ OCR complete — {len(pages)} pages, {len(full_text)} chars")
-        return full_text
+        if failed_pages:
+            print(f"⚠️  OCR incomplete — pages {failed_pages} failed, result cached as partial")
+
+        if not has_pending:
+            os.unlink(tmp_path)
+            tmp_path = None
+        return full_text, not failed_pages and not has_pending, tmp_path
 
     except Exception as e:
         print(f"❌ OCR from URL failed: {e}")
-        return ""
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        return "", False, None
+
+
+# Background lazy-OCR tasks by assignment id (also keeps the tasks referenced)
+_lazy_ocr_tasks = {}
+
+
+async def _lazy_extract_text_from_url(file_url: str, assignment_id: str) -> tuple:
+    """
+    OCR only the first settings.CHAT_LAZY_OCR_PAGES pages (text-layer pages are
+    read directly regardless) so chat can answer right away, cache that partial
+    text, and finish the remaining pages in the background.
+    Returns (text, complete).
+    """
+    first_pages = set(range(1, settings.CHAT_LAZY_OCR_PAGES + 1))
+    pdf_text, complete, tmp_path = await _extract_text_from_url(file_url, assignment_id, first_pages)
+
+    # Cached even when pages failed, so later turns retry through
+    # _start_background_ocr (capped and spaced out) instead of OCRing inline
+    await _save_ocr_cache(assignment_id, pdf_text, complete=complete)
+    if tmp_path:
+        # Pages are still pending - finish them in the background
+        _start_background_ocr(file_url, assignment_id, tmp_path)
+
+    return pdf_text, complete
+
+
+def _background_ocr_due(cached: dict) -> bool:
+    """
+    Whether a partial cache entry may be picked up again: at most
+    OCR_BACKGROUND_MAX_ATTEMPTS incomplete passes, the n-th retry waiting
+    OCR_BACKGROUND_RETRY_DELAY * 2^(n-1) seconds after the previous pass.
+    Keeps a page that always fails from being re-OCR'd on every chat turn.
+    """
+    attempts = cached.get("attempts", 0)
+    if attempts >= settings.OCR_BACKGROUND_MAX_ATTEMPTS:
+        return False
+    if not attempts or cached.get("attempted_at") is None:
+        return True
+    delay = settings.OCR_BACKGROUND_RETRY_DELAY * 2 ** (attempts - 1)
+    return datetime.utcnow() >= cached["attempted_at"] + timedelta(seconds=delay)
+
+
+def _start_background_ocr(file_url: str, assignment_id: str, tmp_path: Optional[str] = None):
+    """
+    Finish an assignment's OCR in the background. With tmp_path this continues
+    a lazy first pass; without it, it retries a partial result (callers check
+    _background_ocr_due first).
+    """
+    task = _lazy_ocr_tasks.get(assignment_id)
+    if task and not task.done():
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        return
+
+    async def _save_progress(pages: list):
+        # Chat turns during a long run see each batch of pages as it lands
+        await _save_ocr_cache(assignment_id, _join_pages(pages), complete=False, end_of_pass=False)
+
+    async def _finish():
+        heartbeat = None
+        try:
+            if not await claim_ocr_lease(assignment_id, settings.OCR_LEASE_SECONDS):
+                # Another process is already finishing this assignment
+                if tmp_path and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                return
+            heartbeat = asyncio.create_task(_renew_ocr_lease(assignment_id))
+            print(f"🔄 Background OCR started for {assignment_id}")
+            pdf_text, complete, _ = await _extract_text_from_url(
+                file_url, assignment_id, tmp_path=tmp_path, on_progress=_save_progress
+            )
+            # A failed download returns no text; keep the cached pages but count the attempt
+            await _save_ocr_cache(assignment_id, pdf_text if pdf_text or complete else None, complete=complete)
+            print(f"✅ Background OCR finished for {assignment_id} (complete: {complete})")
+        finally:
+            _lazy_ocr_tasks.pop(assignment_id, None)
+            if heartbeat:
+                heartbeat.cancel()
+                await release_ocr_lease(assignment_id)
+
+    _lazy_ocr_tasks[assignment_id] = asyncio.create_task(_finish())
+
+
+# In-flight OCR of an assignment in this process; concurrent cache misses await
+# the same task instead of downloading and OCRing the file again
+_ocr_flights = {}
+
+
+async def _single_flight_ocr(file_url: str, assignment_id: str) -> tuple:
+    """OCR an assignment whose text isn't cached, at most once at a time. Returns (text, complete)."""
+    flight = _ocr_flights.get(assignment_id)
+    if flight is None:
+        flight = asyncio.create_task(_ocr_flight(file_url, assignment_id))
+        _ocr_flights[assignment_id] = flight
+        flight.add_done_callback(lambda _: _ocr_flights.pop(assignment_id, None))
+    else:
+        print(f"⏳ OCR for {assignment_id} already running — waiting for it")
+    # shield: a cancelled request must not cancel the OCR other requests wait on
+    return await asyncio.shield(flight)
+
+
+async def _ocr_flight(file_url: str, assignment_id: str) -> tuple:
+    deadline = time.monotonic() + settings.OCR_SINGLE_FLIGHT_WAIT_SECONDS
+    while not await claim_ocr_lease(assignment_id, settings.OCR_LEASE_SECONDS):
+        # Another process is OCRing it; use its result as soon as it is cached.
+        # The holder caches an incomplete entry on failure and drops the lease,
+        # so this returns (or claims the lease) right away in that case too
+        cached = await _get_cached_ocr(assignment_id)
+        if cached is not None:
+            return cached["full_text"], cached["complete"]
+        if time.monotonic() > deadline:
+            print(f"⚠️  Waited {settings.OCR_SINGLE_FLIGHT_WAIT_SECONDS}s on another process's OCR for {assignment_id} — running it here")
+            break
+        await asyncio.sleep(settings.OCR_LEASE_POLL_INTERVAL)
+
+    # The previous holder may have finished between our cache miss and the claim
+    cached = await _get_cached_ocr(assignment_id)
+    if cached is not None:
+        await release_ocr_lease(assignment_id)
+        return cached["full_text"], cached["complete"]
+
+    heartbeat = asyncio.create_task(_renew_ocr_lease(assignment_id))
+    try:
+        if settings.CHAT_LAZY_OCR:
+            print(f"⚠️  OCR Cache MISS — running lazy OCR on the first {settings.CHAT_LAZY_OCR_PAGES} pages...")
+            return await _lazy_extract_text_from_url(file_url, assignment_id)
+
+        print(f"⚠️  OCR Cache MISS — running OCR now...")
+        pdf_text, complete, _ = await _extract_text_from_url(file_url, assignment_id)
+        # Incomplete results are cached too; later turns retry in the background
+        await _save_ocr_cache(assignment_id, pdf_text, complete=complete)
+        return pdf_text, complete
+    except Exception:
+        # Leave an incomplete entry, so processes polling in the loop above
+        # return at once instead of waiting out OCR_SINGLE_FLIGHT_WAIT_SECONDS
+        await _save_ocr_cache(assignment_id, None, complete=False)
+        raise
+    finally:
+        heartbeat.cancel()
+        # A background task finishing the remaining pages keeps the lease
+        if assignment_id not in _lazy_ocr_tasks:
+            await release_ocr_lease(assignment_id)
+
+
+# ─────────────────────────────────────────────
+# ASSIGNMENT CACHE (composed assignments, see assignment_cache.py)
+# ─────────────────────────────────────────────
+
+def _assignment_cache_collection():
+    if database is None or not settings.ASSIGNMENT_CACHE_SHARED:
+        return None
+    return database["assignment_cache"]
+
+
+async def invalidate_assignment_cache(assignment_id: str):
+    await assignment_cache.invalidate(assignment_id, _assignment_cache_collection())
 
 
 # ─────────────────────────────────────────────
@@ -159,40 +897,53 @@ async def _extract_text_from_url(file_url: str) -> str:
 # ─────────────────────────────────────────────
 
 async def save_assignment(assignment_data: dict):
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        response = await client.post(
-            f"{REMOTE_API_BASE}/assignments",
-            json=assignment_data
-        )
-        response.raise_for_status()
-        return response.json()
+    response = await http().post(
+        f"{REMOTE_API_BASE}/assignments",
+        json=assignment_data
+    )
+    response.raise_for_status()
+    return response.json()
 
 
 async def get_all_assignments(teacher_id: Optional[str] = None) -> List[dict]:
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            params = {"teacher_id": teacher_id} if teacher_id else {}
-            response = await client.get(f"{REMOTE_API_BASE}/assignments", params=params)
-            response.raise_for_status()
-            data = response.json()
-            assignments = data.get("assignments", data) if isinstance(data, dict) else data
-            return [_normalize(a) for a in assignments]
+        params = {"teacher_id": teacher_id} if teacher_id else {}
+        response = await http().get(f"{REMOTE_API_BASE}/assignments", params=params)
+        response.raise_for_status()
+        data = response.json()
+        assignments = data.get("assignments", data) if isinstance(data, dict) else data
+        return [_normalize(a) for a in assignments]
     except Exception as e:
         print(f"❌ Remote API error (get_all_assignments): {e}")
         return []
 
 
+async def get_remote_assignment(assignment_id: str) -> Optional[dict]:
+    """The assignment record exactly as the remote API stores it (no OCR)"""
+    response = await http().get(f"{REMOTE_API_BASE}/assignments/{assignment_id}")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    data = response.json()
+
+    return _normalize(data.get("data", data))
+
+
 async def get_assignment_by_id(assignment_id: str) -> Optional[dict]:
+    """
+    The remote record plus its OCR text and the composed full_text. Served from
+    the assignment cache when possible; only complete results are cached.
+    """
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            response = await client.get(f"{REMOTE_API_BASE}/assignments/{assignment_id}")
-            if response.status_code == 404:
-                return None
-            response.raise_for_status()
-            data = response.json()
+        if settings.ASSIGNMENT_CACHE_ENABLED:
+            cached_assignment = await assignment_cache.get(assignment_id, _assignment_cache_collection())
+            if cached_assignment is not None:
+                print(f"✅ Assignment cache HIT for {assignment_id}")
+                return cached_assignment
 
-        assignment = data.get("data", data)
-        _normalize(assignment)
+        assignment = await get_remote_assignment(assignment_id)
+        if assignment is None:
+            return None
 
         title        = assignment.get("title", "")
         subject      = (assignment.get("subject") or {}).get("name", "")
@@ -209,15 +960,22 @@ async def get_assignment_by_id(assignment_id: str) -> Optional[dict]:
         print(f"{'='*60}")
 
         # Cache check
-        pdf_text = await _get_cached_ocr(assignment_id)
+        cached = await _get_cached_ocr(assignment_id)
 
-        if pdf_text is None:
-            print(f"⚠️  OCR Cache MISS — running OCR now...")
-            if file_url:
-                pdf_text = await _extract_text_from_url(file_url)
-                await _save_ocr_cache(assignment_id, pdf_text)
-            else:
-                pdf_text = ""
+        if cached is not None:
+            pdf_text = cached["full_text"]
+            complete = cached["complete"]
+            if not complete and file_url:
+                # Partial result; make sure someone is finishing it, within the retry budget
+                if _background_ocr_due(cached):
+                    _start_background_ocr(file_url, assignment_id)
+                else:
+                    print(f"⏸️ Background OCR for {assignment_id} not due (attempt limit or backoff)")
+        elif file_url:
+            pdf_text, complete = await _single_flight_ocr(file_url, assignment_id)
+        else:
+            pdf_text = ""
+            complete = True
 
         parts = [
             f"Assignment Title: {title}",
@@ -240,6 +998,9 @@ async def get_assignment_by_id(assignment_id: str) -> Optional[dict]:
         assignment["full_text"] = "\n".join(parts).strip()
         print(f"✅ full_text ready — {len(assignment['full_text'])} total chars")
 
+        if complete and settings.ASSIGNMENT_CACHE_ENABLED:
+            await assignment_cache.set(assignment_id, assignment, _assignment_cache_collection())
+
         return assignment
 
     except Exception as e:
@@ -255,11 +1016,11 @@ async def get_assignment_full_text(assignment_id: str) -> Optional[str]:
 
 
 async def delete_assignment(assignment_id: str) -> bool:
+    await invalidate_assignment_cache(assignment_id)
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            response = await client.delete(f"{REMOTE_API_BASE}/assignments/{assignment_id}")
-            response.raise_for_status()
-            return True
+        response = await http().delete(f"{REMOTE_API_BASE}/assignments/{assignment_id}")
+        response.raise_for_status()
+        return True
     except Exception as e:
         print(f"❌ Remote API error (delete_assignment): {e}")
         return False
@@ -267,15 +1028,14 @@ async def delete_assignment(assignment_id: str) -> bool:
 
 async def search_assignments(query: str, teacher_id: Optional[str] = None) -> List[dict]:
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            params = {"q": query}
-            if teacher_id:
-                params["teacher_id"] = teacher_id
-            response = await client.get(f"{REMOTE_API_BASE}/assignments/search", params=params)
-            response.raise_for_status()
-            data = response.json()
-            assignments = data.get("assignments", data) if isinstance(data, dict) else data
-            return [_normalize(a) for a in assignments]
+        params = {"q": query}
+        if teacher_id:
+            params["teacher_id"] = teacher_id
+        response = await http().get(f"{REMOTE_API_BASE}/assignments/search", params=params)
+        response.raise_for_status()
+        data = response.json()
+        assignments = data.get("assignments", data) if isinstance(data, dict) else data
+        return [_normalize(a) for a in assignments]
     except Exception as e:
         print(f"❌ Remote API error (search_assignments): {e}")
         return []
@@ -283,9 +1043,8 @@ async def search_assignments(query: str, teacher_id: Optional[str] = None) -> Li
 
 async def get_database_stats() -> dict:
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            response = await client.get(f"{REMOTE_API_BASE}/stats")
-            response.raise_for_status()
-            return response.json()
+        response = await http().get(f"{REMOTE_API_BASE}/stats")
+        response.raise_for_status()
+        return response.json()
     except Exception as e:
         return {"total_assignments": 0, "error": str(e)}
\ No newline at end of file
@@ -1,25 +1,206 @@
 from fastapi import UploadFile
 import os
 import shutil
+import hashlib
+import io
+import csv
+import json
+import asyncio
+import time
+import zipfile
 import aiofiles
+from typing import List, Optional
 from app.config import settings
 
-async def process_uploaded_file(file: UploadFile, assignment_id: str) -> str:
-    """
-    Save uploaded file temporarily (async version for better performance)
-    """
-    # Get file extension
-    file_extension = os.path.splitext(file.filename)[1]
-    
-    # Create temp file path
-    temp_path = os.path.join(settings.UPLOAD_DIR, f"{assignment_id}{file_extension}")
-    
-    # Save file asynchronously
-    async with aiofiles.open(temp_path, "wb") as buffer:
-        content = await file.read()
-        await buffer.write(content)
-    
-    return temp_path
+class FileTooLargeError(Exception):
+    """Raised when an upload exceeds settings.MAX_FILE_SIZE"""
+    pass
+
+
+async def stream_uploaded_file(file: UploadFile, *writers) -> dict:
+    """
+    Read an upload in UPLOAD_CHUNK_SIZE chunks, passing every chunk to each of
+    the async writers, while enforcing settings.MAX_FILE_SIZE and hashing the
+    content on the way.
+
+    Returns {'size', 'sha256'}. Raises FileTooLargeError as soon as the limit is
+    crossed; cleaning up whatever the writers produced is up to the caller.
+    """
+    max_size = settings.MAX_FILE_SIZE
+    if file.size is not None and file.size > max_size:
+        raise FileTooLargeError(f"{file.filename} is {file.size} bytes, limit is {max_size} bytes")
+
+    sha256 = hashlib.sha256()
+    size = 0
+    while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise FileTooLargeError(f"{file.filename} exceeds the {max_size} byte limit")
+        sha256.update(chunk)
+        for write in writers:
+            await write(chunk)
+
+    return {
+        'size': size,
+        'sha256': sha256.hexdigest()
+    }
+
+
+class SpooledUpload:
+    """
+    Copy of an upload kept for the OCR stage: in memory while it is at most
+    settings.UPLOAD_SPOOL_MAX_MEMORY bytes, spilled to a temp file in
+    UPLOAD_DIR beyond that. Use write() as a stream_uploaded_file writer.
+    """
+
+    def __init__(self, assignment_id: str, file_extension: str):
+        self.size = 0
+        self.spill_path = os.path.join(settings.UPLOAD_DIR, f"{assignment_id}{file_extension}")
+        self._memory = io.BytesIO()
+        self._file = None
+
+    @property
+    def in_memory(self) -> bool:
+        return self._memory is not None
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.in_memory and self.size > settings.UPLOAD_SPOOL_MAX_MEMORY:
+            self._file = await aiofiles.open(self.spill_path, "wb")
+            await self._file.write(self._memory.getvalue())
+            self._memory = None
+
+        if self.in_memory:
+            self._memory.write(chunk)
+        else:
+            await self._file.write(chunk)
+
+    async def close(self):
+        """Finish writing; call before handing the upload to OCR"""
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+
+    def getvalue(self) -> Optional[bytes]:
+        """The content if it stayed in memory, otherwise None (read spill_path)"""
+        return self._memory.getvalue() if self.in_memory else None
+
+
+class StagedUpload:
+    """
+    Staging file of a resumable upload (UPLOAD_DIR/<upload_id>.part).
+    append() writes a chunk at the given offset; self.offset always reflects
+    the bytes safely on disk, even if the chunk was cut off half-way.
+    """
+
+    def __init__(self, upload_id: str, offset: int, size: int):
+        self.path = os.path.join(settings.UPLOAD_DIR, f"{upload_id}.part")
+        self.offset = offset
+        self.size = size
+
+    def bytes_on_disk(self) -> int:
+        """Size of the staging file on this node, 0 if it isn't here"""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    async def append(self, chunks):
+        """Append an async iterator of bytes; raises FileTooLargeError past the declared size"""
+        mode = "r+b" if os.path.exists(self.path) else "wb"
+        async with aiofiles.open(self.path, mode) as buffer:
+            # Drop anything past the recorded offset (left over from a cut-off chunk)
+            await buffer.truncate(self.offset)
+            await buffer.seek(self.offset)
+            try:
+                async for chunk in chunks:
+                    if self.offset + len(chunk) > self.size:
+                        raise FileTooLargeError(f"Chunk goes past the declared size of {self.size} bytes")
+                    await buffer.write(chunk)
+                    self.offset += len(chunk)
+            finally:
+                await buffer.flush()
+
+
+def sweep_stale_staged_uploads(max_age_seconds: float) -> List[str]:
+    """
+    Delete staging files (UPLOAD_DIR/<upload_id>.part) nobody has written to
+    for max_age_seconds. Returns the upload ids whose files were removed.
+    """
+    cutoff = time.time() - max_age_seconds
+    removed = []
+    try:
+        names = os.listdir(settings.UPLOAD_DIR)
+    except FileNotFoundError:
+        return removed
+    for name in names:
+        if not name.endswith(".part"):
+            continue
+        path = os.path.join(settings.UPLOAD_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed.append(name[:-len(".part")])
+        except OSError as e:
+            print(f"Failed to cleanup file {path}: {e}")
+    return removed
+
+
+class ZipMemberUpload:
+    """
+    One member of a ZIP archive, read straight out of the archive with the same
+    interface ingest_upload uses on an UploadFile (filename, content_type,
+    size, async read), so nothing is extracted to disk first.
+    """
+
+    def __init__(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo, content_type: Optional[str] = None):
+        self.filename = os.path.basename(info.filename)
+        self.content_type = content_type
+        self.size = info.file_size
+        self._archive = archive
+        self._info = info
+        self._stream = None
+
+    async def read(self, size: int = -1) -> bytes:
+        if self._stream is None:
+            self._stream = await asyncio.to_thread(self._archive.open, self._info)
+        chunk = await asyncio.to_thread(self._stream.read, size)
+        if not chunk:
+            self._stream.close()
+        return chunk
+
+
+def parse_upload_manifest(data: bytes, filename: str) -> List[dict]:
+    """
+    Manifest for a ZIP upload: a JSON list (or {"files": [...]}) or a CSV with
+    a header row. Each entry needs "file" (path inside the archive), "title"
+    and "teacher_id"; "subject" is optional. Raises ValueError if malformed.
+    """
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".json") or text.lstrip().startswith(("[", "{")):
+        entries = json.loads(text)
+        if isinstance(entries, dict):
+            entries = entries.get("files", [])
+    else:
+        entries = list(csv.DictReader(io.StringIO(text)))
+
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("Manifest lists no files")
+
+    manifest = []
+    for number, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Manifest entry {number} is not an object")
+        missing = [key for key in ("file", "title", "teacher_id") if not (entry.get(key) or "").strip()]
+        if missing:
+            raise ValueError(f"Manifest entry {number} is missing {', '.join(missing)}")
+        manifest.append({
+            "file": entry["file"].strip().lstrip("/"),
+            "title": entry["title"].strip(),
+            "teacher_id": entry["teacher_id"].strip(),
+            "subject": (entry.get("subject") or "").strip() or None
+        })
+    return manifest
 
 
 def cleanup_temp_file(file_path: str):
@@ -0,0 +1,654 @@
+from fastapi import UploadFile
+from fastapi.encoders import jsonable_encoder
+from contextlib import contextmanager
+from typing import List, Optional
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from app.config import settings
+from app.services.file_processor import stream_uploaded_file, SpooledUpload, cleanup_temp_file
+from app.services.s3_service import upload_to_s3, download_from_s3, extract_s3_key_from_url, S3MultipartUpload
+from app.services.ocr_service import extract_text_from_file
+from app.services.db_service import (
+    save_assignment,
+    get_remote_assignment,
+    seed_ocr_cache,
+    create_ingest_jobs,
+    get_assignment_file,
+    register_assignment_file,
+    save_assignment_file_pages,
+    claim_idempotency_key,
+    save_idempotent_file_result,
+    renew_idempotency_lease,
+    complete_idempotency_key,
+    release_idempotency_key,
+    get_ingest_jobs,
+    get_ocr_job_progress
+)
+from app.utils.helpers import generate_file_hash
+from app.models.assignment import AssignmentResponse, FailedUpload
+
+# Files being ingested across ALL requests at once. Each upload request is
+# further limited by settings.UPLOAD_FILE_CONCURRENCY (see ingest_upload).
+UPLOAD_SEMAPHORE = asyncio.Semaphore(max(1, settings.UPLOAD_GLOBAL_CONCURRENCY))
+
+
+class StageTimer:
+    """Wall-clock seconds spent in each pipeline stage of one file"""
+
+    def __init__(self):
+        self.timings = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - start, 3)
+
+    def finish(self) -> dict:
+        self.timings['total'] = round(time.perf_counter() - self._started, 3)
+        return self.timings
+
+
+async def ingest_upload(
+    file: UploadFile,
+    title: str,
+    teacher_id: str,
+    subject: Optional[str],
+    label: str,
+    temp_files: list,
+    request_limit: asyncio.Semaphore,
+    verify: bool = False
+) -> dict:
+    """
+    Run one uploaded file through the pipeline (streamed S3 upload -> OCR ->
+    save -> verify), waiting for a slot in both the per-request and the global
+    limit. The upload is streamed straight into an S3 multipart upload and teed
+    into a SpooledUpload for OCR, so small files never touch the disk.
+
+    Never raises: returns {"success": True, "data": ...} or
+    {"success": False, "error": FailedUpload}. Timings are included either way.
+    """
+    timer = StageTimer()
+    try:
+        with timer.stage("queued"):
+            await request_limit.acquire()
+            try:
+                await UPLOAD_SEMAPHORE.acquire()
+            except BaseException:
+                request_limit.release()
+                raise
+
+        try:
+            assignment_id = str(uuid.uuid4())
+
+            print(f"\n{'='*60}")
+            print(f"📤 [{label}] Processing: {file.filename}")
+            print(f"   Title: {title}")
+            print(f"   Subject: {subject}")
+            print(f"   Teacher ID: {teacher_id}")
+            print(f"{'='*60}")
+
+            spool = SpooledUpload(assignment_id, os.path.splitext(file.filename)[1])
+            temp_files.append(spool.spill_path)
+            with timer.stage("upload"):
+                try:
+                    saved = await stream_to_s3(file, assignment_id, spool.write)
+                finally:
+                    await spool.close()
+            s3_url = saved['file_url']
+            print(f"✅ Streamed to S3: {s3_url} ({saved['size']} bytes, {'memory' if spool.in_memory else 'spilled to disk'})")
+
+            data = await ingest_file(
+                spool.spill_path,
+                file_name=file.filename,
+                content_type=file.content_type,
+                title=title,
+                teacher_id=teacher_id,
+                subject=subject,
+                assignment_id=assignment_id,
+                timer=timer,
+                file_hash=saved['sha256'],
+                s3_url=s3_url,
+                data=spool.getvalue(),
+                verify=verify,
+                pages_data=saved['pages']
+            )
+        finally:
+            UPLOAD_SEMAPHORE.release()
+            request_limit.release()
+
+        data["timings"] = timer.finish()
+        print(f"✅ [{label}] SUCCESS: {file.filename} in {data['timings']['total']}s\n")
+        return {
+            "success": True,
+            "data": data
+        }
+
+    except Exception as e:
+        print(f"❌ [{label}] FAILED: {file.filename}")
+        print(f"   Error: {str(e)}\n")
+        return {
+            "success": False,
+            "error": FailedUpload(
+                file_name=file.filename,
+                error=str(e),
+                timings=timer.finish()
+            )
+        }
+
+
+async def stream_to_s3(file: UploadFile, assignment_id: str, *writers) -> dict:
+    """
+    Stream an upload into an S3 multipart upload, also passing each chunk to
+    the extra writers. Returns {'size', 'sha256', 'file_url', 's3_key', 'pages'};
+    the multipart upload is aborted if anything fails.
+
+    Content whose sha256 is already in assignment_files is not stored again:
+    the multipart upload is aborted and the existing object (plus its OCR
+    pages, if extracted) is returned instead.
+    """
+    s3_upload = S3MultipartUpload(assignment_id, file.filename)
+    try:
+        saved = await stream_uploaded_file(file, s3_upload.write, *writers)
+
+        # Identical content already stored: drop the parts we sent and reuse it
+        known = await get_assignment_file(saved['sha256'])
+        if known:
+            await s3_upload.abort()
+            print(f"♻️ {file.filename} is identical to an earlier upload - reusing {known['file_url']}")
+            saved.update(file_url=known['file_url'], s3_key=known['s3_key'], pages=known.get('pages'))
+            return saved
+
+        saved['file_url'] = await s3_upload.complete()
+    except BaseException:
+        await s3_upload.abort()
+        raise
+    saved['s3_key'] = s3_upload.s3_key
+    saved['pages'] = None
+    await register_assignment_file(saved['sha256'], saved['file_url'], saved['s3_key'], file.filename, saved['size'])
+    return saved
+
+
+async def enqueue_uploads(
+    files: List[UploadFile],
+    titles: List[str],
+    teacher_ids: List[str],
+    subjects: List[Optional[str]],
+    verify: bool = False
+) -> dict:
+    """
+    Async ingest: stage every file in S3 and queue one ingest job per file for
+    app.worker, without waiting for OCR. Returns the batch id (which
+    get_ingest_status also accepts) and a per-file entry with its own job id,
+    or the error for a file that could not be staged.
+    """
+    batch_id = str(uuid.uuid4())
+    request_limit = asyncio.Semaphore(max(1, settings.UPLOAD_FILE_CONCURRENCY))
+
+    async def _stage(index: int, file: UploadFile, title: str, teacher_id: str, subject: Optional[str]) -> dict:
+        assignment_id = str(uuid.uuid4())
+        async with request_limit:
+            try:
+                saved = await stream_to_s3(file, assignment_id)
+            except Exception as e:
+                print(f"❌ [{index+1}/{len(files)}] Staging failed: {file.filename} - {str(e)}")
+                return {"file_name": file.filename, "status": "failed", "error": str(e)}
+
+        print(f"📥 [{index+1}/{len(files)}] Staged {file.filename} ({saved['size']} bytes) for async ingest")
+        return _ingest_job(
+            batch_id, index, assignment_id, title, teacher_id, subject,
+            file.filename, file.content_type, saved, verify
+        )
+
+    staged = await asyncio.gather(*[
+        _stage(idx, file, title, teacher_id, subject)
+        for idx, (file, title, teacher_id, subject) in enumerate(zip(files, titles, teacher_ids, subjects))
+    ])
+
+    jobs = [entry for entry in staged if "_id" in entry]
+    if jobs:
+        await create_ingest_jobs(jobs)
+
+    return {
+        "job_id": batch_id,
+        "status": "queued",
+        "files": [
+            {
+                "job_id": entry["_id"],
+                "assignment_id": entry["assignment_id"],
+                "file_name": entry["file_name"],
+                "status": "queued"
+            } if "_id" in entry else entry
+            for entry in staged
+        ]
+    }
+
+
+def _ingest_job(
+    batch_id: str,
+    index: int,
+    assignment_id: str,
+    title: str,
+    teacher_id: str,
+    subject: Optional[str],
+    file_name: str,
+    content_type: Optional[str],
+    saved: dict,
+    verify: bool
+) -> dict:
+    """ingest_jobs document for a file staged in S3 (saved: file_url, s3_key, size, sha256)"""
+    return {
+        "_id": str(uuid.uuid4()),
+        "batch_id": batch_id,
+        "index": index,
+        "assignment_id": assignment_id,
+        "title": title,
+        "teacher_id": teacher_id,
+        "subject": subject,
+        "file_name": file_name,
+        "content_type": content_type,
+        "file_url": saved['file_url'],
+        "s3_key": saved['s3_key'],
+        "size": saved['size'],
+        "sha256": saved['sha256'],
+        "verify": verify
+    }
+
+
+async def enqueue_staged_file(
+    path: str,
+    file_name: str,
+    content_type: Optional[str],
+    title: str,
+    teacher_id: str,
+    subject: Optional[str],
+    verify: bool = False
+) -> dict:
+    """
+    Queue a file that is already complete on local disk (e.g. a finished
+    resumable upload) for the ingest worker: store it in S3 unless identical
+    content is already there, then create its ingest job. Returns the job.
+    """
+    assignment_id = str(uuid.uuid4())
+    saved = {
+        'size': os.path.getsize(path),
+        'sha256': await asyncio.to_thread(generate_file_hash, path)
+    }
+
+    known = await get_assignment_file(saved['sha256'])
+    if known:
+        print(f"♻️ {file_name} is identical to an earlier upload - reusing {known['file_url']}")
+        saved.update(file_url=known['file_url'], s3_key=known['s3_key'])
+    else:
+        saved['file_url'] = await upload_to_s3(path, assignment_id, file_name)
+        saved['s3_key'] = extract_s3_key_from_url(saved['file_url'])
+        await register_assignment_file(saved['sha256'], saved['file_url'], saved['s3_key'], file_name, saved['size'])
+
+    job = _ingest_job(
+        str(uuid.uuid4()), 0, assignment_id, title, teacher_id, subject,
+        file_name, content_type, saved, verify
+    )
+    await create_ingest_jobs([job])
+    return job
+
+
+async def run_ingest_job(job: dict) -> dict:
+    """
+    Worker side of an async ingest: fetch the staged file from S3 and run the
+    rest of the pipeline. Returns the assignment response dict with timings.
+    """
+    timer = StageTimer()
+    temp_path = os.path.join(settings.UPLOAD_DIR, f"{job['assignment_id']}{os.path.splitext(job['file_name'])[1]}")
+    known = await get_assignment_file(job['sha256'])
+    pages_data = known.get('pages') if known else None
+    try:
+        if not pages_data:
+            with timer.stage("download"):
+                await download_from_s3(job['s3_key'], temp_path)
+
+        data = await ingest_file(
+            temp_path,
+            file_name=job['file_name'],
+            content_type=job.get('content_type'),
+            title=job['title'],
+            teacher_id=job['teacher_id'],
+            subject=job.get('subject'),
+            assignment_id=job['assignment_id'],
+            timer=timer,
+            file_hash=job.get('sha256'),
+            s3_url=job['file_url'],
+            verify=job.get('verify', False),
+            pages_data=pages_data
+        )
+    finally:
+        cleanup_temp_file(temp_path)
+
+    data["timings"] = timer.finish()
+    return data
+
+
+def _describe_ingest_job(job: dict, ocr_progress: Optional[dict]) -> dict:
+    return {
+        "job_id": job["_id"],
+        "assignment_id": job["assignment_id"],
+        "file_name": job["file_name"],
+        "status": job["status"],
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "timings": job.get("timings"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+        "ocr": ocr_progress
+    }
+
+
+async def get_ingest_status(job_id: str) -> Optional[dict]:
+    """
+    Progress of a file job, or of every file in a batch, including the
+    per-page progress of each file's OCR job.
+    """
+    jobs = await get_ingest_jobs(job_id)
+    if not jobs:
+        return None
+
+    progress = await asyncio.gather(*[get_ocr_job_progress(job["assignment_id"]) for job in jobs])
+    files = [_describe_ingest_job(job, ocr) for job, ocr in zip(jobs, progress)]
+    if len(jobs) == 1 and jobs[0]["_id"] == job_id:
+        return files[0]
+
+    statuses = {f["status"] for f in files}
+    if statuses <= {"processed", "failed"}:
+        status = "failed" if statuses == {"failed"} else "completed"
+    elif statuses & {"running", "processed", "failed"}:
+        status = "running"
+    else:
+        status = "queued"
+
+    return {
+        "job_id": job_id,
+        "status": status,
+        "total_files": len(files),
+        "processed": sum(1 for f in files if f["status"] == "processed"),
+        "failed": sum(1 for f in files if f["status"] == "failed"),
+        "files": files
+    }
+
+
+class IdempotencyConflictError(Exception):
+    """An Idempotency-Key can't be served: reused for a different request, or still running"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def upload_fingerprint(files: List[UploadFile], *params) -> str:
+    """Identifies the request an Idempotency-Key was first used with"""
+    payload = [[file.filename, file.size] for file in files] + [list(params)]
+    return hashlib.sha256(json.dumps(payload, default=str).encode()).hexdigest()
+
+
+class IdempotentUpload:
+    """
+    Ownership of an Idempotency-Key for the duration of one upload request.
+    Each finished file is saved under the key as it completes, so if this
+    request dies, the retry that takes over only redoes the files that hadn't
+    succeeded.
+    """
+
+    def __init__(self, key: str, owner: str, results: dict):
+        self.key = key
+        self.owner = owner
+        self._results = results or {}
+        self._heartbeat = None
+        self._done = False
+
+    def previous_result(self, index: int) -> Optional[dict]:
+        """Successful result an earlier attempt stored for this file, if any"""
+        result = self._results.get(str(index))
+        return result if result and result.get("success") else None
+
+    async def save_result(self, index: int, result: dict):
+        await save_idempotent_file_result(
+            self.key, self.owner, index, jsonable_encoder(result), settings.UPLOAD_IDEMPOTENCY_LEASE_SECONDS
+        )
+
+    async def _renew(self):
+        interval = max(1, settings.UPLOAD_IDEMPOTENCY_LEASE_SECONDS // 3)
+        while True:
+            await asyncio.sleep(interval)
+            await renew_idempotency_lease(self.key, self.owner, settings.UPLOAD_IDEMPOTENCY_LEASE_SECONDS)
+
+    def start_heartbeat(self):
+        self._heartbeat = asyncio.create_task(self._renew())
+
+    def _stop_heartbeat(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    async def complete(self, status_code: int, body) -> dict:
+        self._stop_heartbeat()
+        body = jsonable_encoder(body)
+        await complete_idempotency_key(self.key, self.owner, status_code, body)
+        self._done = True
+        return body
+
+    async def release(self):
+        """Give up the key without a final response; finished files stay stored"""
+        self._stop_heartbeat()
+        if not self._done:
+            self._done = True
+            await release_idempotency_key(self.key, self.owner)
+
+
+async def begin_idempotent_upload(key: str, fingerprint: str) -> tuple:
+    """
+    Returns (IdempotentUpload, None) when this request should do the work, or
+    (None, {"status_code", "body"}) with the stored response of the original
+    request. While another request holds the key, waits up to
+    UPLOAD_IDEMPOTENCY_WAIT_SECONDS for it to finish before giving up with 409.
+    """
+    owner = str(uuid.uuid4())
+    deadline = time.monotonic() + settings.UPLOAD_IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        record = await claim_idempotency_key(
+            key, fingerprint, owner,
+            settings.UPLOAD_IDEMPOTENCY_LEASE_SECONDS,
+            settings.UPLOAD_IDEMPOTENCY_TTL_SECONDS
+        )
+        if record.get("fingerprint") != fingerprint:
+            raise IdempotencyConflictError("Idempotency-Key was already used with a different request", 422)
+        if record["owned"]:
+            if record.get("results"):
+                print(f"♻️ Idempotency-Key {key}: resuming, {len(record['results'])} files already done")
+            upload = IdempotentUpload(key, owner, record.get("results"))
+            upload.start_heartbeat()
+            return upload, None
+        if record["status"] == "completed":
+            print(f"♻️ Idempotency-Key {key}: replaying the original response")
+            return None, {"status_code": record["status_code"], "body": record["body"]}
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflictError("A request with this Idempotency-Key is still in progress, retry later", 409)
+        await asyncio.sleep(1)
+
+
+async def ingest_file(
+    temp_path: str,
+    file_name: str,
+    content_type: Optional[str],
+    title: str,
+    teacher_id: str,
+    subject: Optional[str],
+    assignment_id: str,
+    timer: StageTimer,
+    file_hash: Optional[str] = None,
+    s3_url: Optional[str] = None,
+    data: Optional[bytes] = None,
+    verify: bool = False,
+    pages_data: Optional[list] = None
+) -> dict:
+    """
+    Upload a saved file to S3, OCR it, store the assignment and read it back.
+    file_hash is the content sha256 if already known (computed otherwise).
+    s3_url skips the S3 upload for a file that was already streamed there, and
+    data OCRs the content from memory (temp_path then only names the file).
+    pages_data are pages already extracted for identical content (a dedupe
+    hit); OCR is skipped and only a new assignment record is created.
+    verify re-reads the saved record from the remote API and compares it.
+    Returns the response dict for the assignment; raises on any failure.
+    """
+    if file_hash is None:
+        file_hash = await asyncio.to_thread(generate_file_hash, temp_path)
+
+    # Upload to S3, unless this content is already stored there
+    if s3_url is None:
+        known = await get_assignment_file(file_hash)
+        if known:
+            s3_url = known["file_url"]
+            pages_data = pages_data or known.get("pages")
+            print(f"♻️ Identical file already stored - reusing {s3_url}")
+        else:
+            with timer.stage("s3_upload"):
+                s3_url = await upload_to_s3(temp_path, assignment_id, file_name)
+            print(f"✅ Uploaded to S3: {s3_url}")
+            await register_assignment_file(
+                file_hash, s3_url, extract_s3_key_from_url(s3_url), file_name, os.path.getsize(temp_path)
+            )
+
+    if pages_data:
+        print(f"♻️ Reusing {len(pages_data)} OCR pages from an identical upload - skipping OCR")
+    else:
+        # Extract text with OCR - THIS IS THE CRITICAL PART
+        # The OCR job is keyed by file content, so retrying the same file
+        # resumes from its checkpointed pages instead of starting over
+        print(f"🔍 Starting OCR extraction...")
+        with timer.stage("ocr"):
+            pages_data = await extract_text_from_file(
+                temp_path,
+                job_id=f"file:{file_hash}",
+                assignment_id=assignment_id,
+                data=data
+            )
+        if pages_data and not any(page.get('error') or page['extraction_method'] == 'pending' for page in pages_data):
+            await save_assignment_file_pages(file_hash, pages_data)
+
+    # Verify OCR results
+    if not pages_data or len(pages_data) == 0:
+        raise Exception(f"OCR failed - no pages extracted from {file_name}")
+
+    failed_pages = [page['page_number'] for page in pages_data if page.get('error')]
+    if failed_pages:
+        raise Exception(
+            f"OCR failed on pages {failed_pages} of {file_name} - "
+            f"retry the upload to resume from the completed pages"
+        )
+
+    print(f"✅ OCR Complete! Extracted {len(pages_data)} pages:")
+    for page in pages_data:
+        print(f"   📄 Page {page['page_number']}: {len(page['content'])} chars, method: {page['extraction_method']}")
+
+    # Create assignment data
+    assignment_data = {
+        "id": assignment_id,
+        "title": title,
+        "subject": subject,
+        "teacher_id": teacher_id,
+        "file_url": s3_url,
+        "file_name": file_name,
+        "file_type": content_type,
+        "pages": pages_data,  # CRITICAL: Must have OCR data
+        "total_pages": len(pages_data),
+        "full_text": " ".join([page["content"] for page in pages_data]),
+        "upload_date": datetime.utcnow(),
+        "status": "processed"
+    }
+
+    # Verify full_text is not empty
+    if not assignment_data["full_text"].strip():
+        print(f"⚠️  WARNING: full_text is empty for {file_name}")
+    else:
+        print(f"✅ full_text length BEFORE save: {len(assignment_data['full_text'])} chars")
+
+    # Save to database
+    print(f"💾 Saving to MongoDB...")
+    with timer.stage("db_save"):
+        await save_assignment(assignment_data)
+    print(f"✅ Saved to MongoDB successfully")
+
+    # Seed the chat OCR cache with what we just extracted, so the first chat
+    # doesn't download and OCR the file all over again
+    await seed_ocr_cache(assignment_id, pages_data)
+
+    verification = None
+    if verify:
+        with timer.stage("verify"):
+            try:
+                verification = await _verify_saved_assignment(assignment_id, assignment_data)
+            except Exception as e:
+                verification = {"status": "error", "error": str(e)}
+
+    # Create response with FULL TEXT included
+    response = AssignmentResponse(
+        id=assignment_id,
+        title=title,
+        subject=subject,
+        teacher_id=teacher_id,
+        file_url=s3_url,
+        total_pages=len(pages_data),
+        upload_date=assignment_data["upload_date"],
+        status="processed",
+        verification=verification
+    )
+
+    # Add full_text to response (convert to dict and add)
+    response_dict = response.dict()
+    response_dict["full_text"] = assignment_data["full_text"]
+    response_dict["full_text_length"] = len(assignment_data["full_text"])
+    response_dict["pages"] = pages_data
+    return response_dict
+
+
+async def _verify_saved_assignment(assignment_id: str, assignment_data: dict) -> dict:
+    """
+    Cheap post-save check: fetch the raw record from the remote API (no OCR)
+    and compare the stored text with what was sent. Records that don't keep
+    the text are checked by page count instead.
+    """
+    saved = await get_remote_assignment(assignment_id)
+    if not saved:
+        print(f"   ❌ VERIFICATION: Could not retrieve saved assignment {assignment_id}!")
+        return {"status": "missing"}
+
+    expected = assignment_data["full_text"]
+    if saved.get("is_chunked"):
+        stored = "".join(saved.get("full_text_chunks") or [])
+    else:
+        stored = saved.get("full_text")
+
+    if stored is None:
+        ok = saved.get("total_pages") in (None, assignment_data["total_pages"])
+        result = {"status": "ok" if ok else "mismatch", "checked": "total_pages"}
+    else:
+        ok = stored == expected
+        result = {
+            "status": "ok" if ok else "mismatch",
+            "checked": "full_text",
+            "expected_length": len(expected),
+            "stored_length": len(stored)
+        }
+
+    if ok:
+        print(f"✅ VERIFICATION: {assignment_id} stored intact ({result['checked']})")
+    else:
+        print(f"⚠️  VERIFICATION MISMATCH for {assignment_id}: {result}")
+    return result
@@ -2,16 +2,118 @@ import os
 import fitz  # PyMuPDF
 from PIL import Image
 import base64
-from openai import OpenAI
+import httpx
+import openai
+from openai import AsyncOpenAI
 from docx import Document
 from app.config import settings
+from app.services import db_service
+from app.services.page_renderer import render_pdf_page as render_page_file, render_pdf_page_isolated
 import asyncio
+import hashlib
+import io
+import math
+import random
 import re
+import tempfile
+import threading
+import unicodedata
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from typing import Optional
 
-# Initialize OpenAI client only if API key is available
+# Initialize OpenAI client only if API key is available.
+# The OCR path uses its own async client and connection pool so in-flight pages
+# don't pin default-executor threads; retries are handled in _create_with_retry.
 client = None
 if settings.OPENAI_API_KEY:
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    client = AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.OCR_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OCR_MAX_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(settings.OCR_REQUEST_TIMEOUT, connect=settings.OCR_CONNECT_TIMEOUT)
+        )
+    )
+
+# Process-wide cap on concurrent vision requests (per-document limits stack under this)
+OCR_SEMAPHORE = asyncio.Semaphore(max(1, settings.OCR_MAX_CONCURRENCY))
+
+OCR_PROMPT = """Extract ALL visible text from this document image exactly as it appears.
+
+IMPORTANT RULES:
+1. Extract EVERY word, number, and symbol
+2. Maintain original formatting and structure
+3. Do NOT add markdown formatting (no ```, no **, no ##)
+4. Do NOT add code blocks
+5. Output plain text only
+6. Preserve line breaks and spacing as they appear
+7. Include all questions, instructions, and content
+
+Start extraction:"""
+
+# Returned for a page the model read (almost) nothing from; never cached
+OCR_MINIMAL_TEXT_MARKER = "[OCR Warning: Minimal text extracted]"
+
+OCR_BATCH_PROMPT = """You will receive {count} document page images (pages {pages}), each preceded by its page label.
+Extract ALL visible text from EVERY page exactly as it appears.
+
+IMPORTANT RULES:
+1. Before each page's text, output a line exactly like: ===== PAGE <number> =====
+2. Output the pages in the order given and never merge two pages
+3. Extract EVERY word, number, and symbol
+4. Maintain original formatting and structure
+5. Do NOT add markdown formatting (no ```, no **, no ##)
+6. Do NOT add code blocks
+7. Output plain text only
+8. Preserve line breaks and spacing as they appear
+9. Include all questions, instructions, and content
+
+Start extraction:"""
+
+PAGE_DELIMITER_RE = re.compile(r'^\s*=====\s*PAGE\s+(\d+)\s*=====\s*$', re.MULTILINE)
+
+# Text-layer density (chars per 1000 pt²) that counts as a fully populated page
+TEXT_LAYER_FULL_DENSITY = 0.5
+
+# Zoom for the blank / duplicate pixel pass (an A4 page is ~300x420 px)
+PIXEL_SCAN_ZOOM = 0.5
+# Difference-hash grid; 32 gives a 1024-bit hash (compared over inked cells only)
+PHASH_GRID = 32
+# Near-duplicate candidates are confirmed by a pixel diff at this zoom
+DUPLICATE_CONFIRM_ZOOM = 1.5
+
+IMAGE_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.bmp': 'image/bmp'
+}
+
+_render_pool = None
+
+# Process-wide rendering / request metrics (see get_ocr_stats)
+ocr_stats = {
+    'pages_rendered': 0,
+    'payload_bytes_total': 0,
+    'requests': 0,
+    'in_flight': 0,
+    'queued': 0,
+    'retried': 0,
+    'failed': 0
+}
+
+
+def _record_render(rendered: dict):
+    ocr_stats['pages_rendered'] += 1
+    ocr_stats['payload_bytes_total'] += rendered['payload_bytes']
+
 
 def clean_ocr_text(text: str) -> str:
     """
@@ -27,94 +129,651 @@ def clean_ocr_text(text: str) -> str:
     return text.strip()
 
 
-async def extract_text_from_file(file_path: str) -> list:
+async def extract_text_from_file(
+    file_path: str,
+    job_id: Optional[str] = None,
+    assignment_id: Optional[str] = None,
+    ocr_page_numbers: Optional[set] = None,
+    data: Optional[bytes] = None,
+    on_progress=None
+) -> list:
     """
     Extract text from any file type (PDF, image, DOCX, TXT)
+
+    Passing job_id makes PDF extraction resumable: finished pages are
+    checkpointed in the ocr_jobs collection and skipped on the next attempt.
+    ocr_page_numbers limits which PDF pages may be OCR'd (see extract_from_pdf).
+    on_progress is awaited with the PDF's pages so far after every checkpoint.
+    With data (the file content already in memory), file_path is only used for
+    its name and extension and nothing is read from disk (PDFs headed for the
+    render pool are written to UPLOAD_DIR once, see _spill_pdf).
     """
     file_extension = os.path.splitext(file_path)[1].lower()
     
     if file_extension == '.pdf':
-        return await extract_from_pdf(file_path)
+        return await extract_from_pdf(
+            file_path,
+            job_id=job_id,
+            assignment_id=assignment_id,
+            ocr_page_numbers=ocr_page_numbers,
+            data=data,
+            on_progress=on_progress
+        )
     elif file_extension in ['.jpg', '.jpeg', '.png', '.bmp']:
-        return await extract_from_image(file_path)
+        return await extract_from_image(file_path, data=data)
     elif file_extension == '.docx':
-        return await extract_from_docx(file_path)
+        return await extract_from_docx(file_path, data=data)
     elif file_extension == '.txt':
-        return await extract_from_txt(file_path)
+        return await extract_from_txt(file_path, data=data)
     else:
         raise ValueError(f"Unsupported file format: {file_extension}")
 
 
-async def extract_from_pdf(pdf_path: str) -> list:
+def score_text_layer(text: str, page_area: float, image_coverage: float = 0.0) -> float:
     """
-    Extract text from ALL pages of PDF using OCR - FORCED ON EVERY PAGE
+    Score a PDF page's embedded text layer between 0 (unusable) and 1 (clean).
+
+    Combines how much of the text is real characters (garbage ratio), how dense
+    the text is for the page size, and how much of the page is covered by images
+    whose text the layer cannot contain.
     """
-    def _extract_pdf():
-        doc = fitz.open(pdf_path)
-        all_pages = []
-        
-        print(f"📄 Starting OCR for PDF with {len(doc)} pages...")
-        
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            
-            print(f"🔍 Processing page {page_num + 1}/{len(doc)} with OCR...")
-            
-            # Convert page to high-quality image
-            mat = fitz.Matrix(3, 3)
-            pix = page.get_pixmap(matrix=mat)
-            img_data = pix.tobytes("png")
-            
-            # Run OCR
-            ocr_text = _ocr_image_bytes_sync(img_data)
-            
-            # Clean the OCR output
-            ocr_text = clean_ocr_text(ocr_text)
-            
-            all_pages.append({
-                'page_number': page_num + 1,
-                'content': ocr_text,
-                'extraction_method': 'ocr'
-            })
-            
-            print(f"✅ Page {page_num + 1} OCR complete - extracted {len(ocr_text)} characters")
-        
+    stripped = text.strip()
+    if not stripped or page_area <= 0:
+        return 0.0
+
+    garbage = sum(1 for ch in stripped if _is_garbage_char(ch))
+    clean_ratio = 1 - garbage / len(stripped)
+
+    # Characters per 1000 square points (an A4 page is ~500 of those)
+    density = len(stripped) / (page_area / 1000)
+    density_factor = min(1.0, density / TEXT_LAYER_FULL_DENSITY)
+
+    coverage_factor = 1.0 - min(1.0, max(0.0, image_coverage))
+
+    return round((clean_ratio ** 2) * density_factor * coverage_factor, 3)
+
+
+def _is_garbage_char(ch: str) -> bool:
+    if ch in '\n\r\t':
+        return False
+    # U+FFFD is what PyMuPDF emits for glyphs without a unicode mapping
+    return ch == '\ufffd' or unicodedata.category(ch) in ('Cc', 'Cf', 'Co', 'Cn', 'Cs')
+
+
+def _image_coverage(page) -> float:
+    """Fraction of the page area covered by embedded images (overlaps not merged)"""
+    page_rect = page.rect
+    page_area = abs(page_rect)
+    if page_area <= 0:
+        return 0.0
+
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info['bbox']) & page_rect
+        covered += abs(bbox)
+
+    return min(1.0, covered / page_area)
+
+
+def _page_pixel_stats(page) -> dict:
+    """
+    Cheap low-resolution pixel pass over a page: ink ratio (for blank detection)
+    and a difference hash over a PHASH_GRID grid (for near-duplicate detection).
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(PIXEL_SCAN_ZOOM, PIXEL_SCAN_ZOOM), colorspace=fitz.csGRAY, alpha=False)
+    gray = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+
+    # Ignore a 5% border so scanner edge shadows and punch holes don't count as ink
+    border_y, border_x = gray.shape[0] // 20, gray.shape[1] // 20
+    inner = gray[border_y:gray.shape[0] - border_y, border_x:gray.shape[1] - border_x]
+    ink_ratio = float(np.count_nonzero(inner < 160)) / max(inner.size, 1)
+
+    phash, ink_bits = _difference_hash(gray)
+    return {
+        'blank': ink_ratio < settings.OCR_BLANK_INK_RATIO,
+        'ink_ratio': ink_ratio,
+        'phash': phash,
+        'ink_bits': ink_bits
+    }
+
+
+def _difference_hash(gray: np.ndarray, grid: int = None) -> tuple:
+    """
+    Average-pool to grid x (grid + 1) cells and compare horizontal neighbours.
+    Returns (hash bits, ink bits); an ink bit marks a hash bit whose cells hold
+    any ink, the only bits worth comparing on a mostly white page.
+    """
+    grid = grid or PHASH_GRID
+    height, width = gray.shape
+    row_edges = np.linspace(0, height, grid + 1, dtype=int)[:-1]
+    col_edges = np.linspace(0, width, grid + 2, dtype=int)[:-1]
+
+    sums = np.add.reduceat(np.add.reduceat(gray.astype(np.float32), row_edges, axis=0), col_edges, axis=1)
+    counts = np.outer(np.diff(np.append(row_edges, height)), np.diff(np.append(col_edges, width)))
+    cells = sums / counts
+    inky = np.minimum.reduceat(np.minimum.reduceat(gray, row_edges, axis=0), col_edges, axis=1) < 160
+
+    return (cells[:, 1:] > cells[:, :-1]).ravel(), (inky[:, 1:] | inky[:, :-1]).ravel()
+
+
+def _hash_distance(a: dict, b: dict) -> float:
+    """Fraction of differing hash bits among the bits where either page has ink"""
+    ink = a['ink_bits'] | b['ink_bits']
+    inked = np.count_nonzero(ink)
+    if not inked:
+        return 0.0
+    return np.count_nonzero((a['phash'] != b['phash']) & ink) / inked
+
+
+def _ink_mask(page) -> np.ndarray:
+    """Dark pixels of the page rendered at DUPLICATE_CONFIRM_ZOOM"""
+    pix = page.get_pixmap(matrix=fitz.Matrix(DUPLICATE_CONFIRM_ZOOM, DUPLICATE_CONFIRM_ZOOM), colorspace=fitz.csGRAY, alpha=False)
+    gray = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    return gray < 160
+
+
+def _ink_masks_match(a: np.ndarray, b: np.ndarray) -> bool:
+    """Confirm a near-duplicate: same size and almost no ink pixels differ"""
+    if a.shape != b.shape:
+        return False
+    inked = np.count_nonzero(a | b)
+    if not inked:
+        return True
+    return np.count_nonzero(a ^ b) / inked <= settings.OCR_DUPLICATE_MAX_PIXEL_DIFF
+
+
+def _plan_page_skips(page_nums: list, page_stats: list, confirm=None) -> tuple:
+    """
+    Split OCR candidates into pages to OCR, blank pages and near-duplicates.
+
+    A page whose hash is close to an earlier page's only counts as its
+    duplicate if confirm(page_num, original) agrees (see _ink_masks_match);
+    without confirm, no page is treated as a duplicate.
+
+    Returns (to_ocr, blank_pages, duplicates) where duplicates maps a page
+    index to the index of the earlier page whose OCR result it reuses.
+    """
+    to_ocr, blank_pages, duplicates = [], [], {}
+    kept_hashes = []
+
+    for page_num, stats in zip(page_nums, page_stats):
+        if settings.OCR_SKIP_BLANK_PAGES and stats['blank']:
+            blank_pages.append(page_num)
+            continue
+
+        if settings.OCR_SKIP_DUPLICATE_PAGES and confirm and kept_hashes:
+            distances = [_hash_distance(stats, kept) for _, kept in kept_hashes]
+            closest = int(np.argmin(distances))
+            original = kept_hashes[closest][0]
+            if distances[closest] <= settings.OCR_DUPLICATE_MAX_DISTANCE and confirm(page_num, original):
+                duplicates[page_num] = original
+                continue
+
+        kept_hashes.append((page_num, stats))
+        to_ocr.append(page_num)
+
+    return to_ocr, blank_pages, duplicates
+
+
+def _render_options() -> dict:
+    """Render settings as a plain dict, so they can be sent to pool workers"""
+    return {
+        'target_px': settings.OCR_RENDER_TARGET_PX,
+        'min_glyph_px': settings.OCR_RENDER_MIN_GLYPH_PX,
+        'min_zoom': settings.OCR_RENDER_MIN_ZOOM,
+        'max_zoom': settings.OCR_RENDER_MAX_ZOOM,
+        'image_format': settings.OCR_IMAGE_FORMAT,
+        'jpeg_quality': settings.OCR_JPEG_QUALITY,
+        'grayscale': settings.OCR_IMAGE_GRAYSCALE,
+        'trim_margins': settings.OCR_TRIM_MARGINS
+    }
+
+
+def render_pool_workers() -> int:
+    return max(1, settings.OCR_RENDER_WORKERS or os.cpu_count() or 1)
+
+
+def get_render_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Lazily created process pool for page rasterization. Uses the spawn start
+    method so workers don't inherit the event loop, Mongo or HTTP client threads.
+    Returns None when OCR_RENDER_IN_PROCESS_POOL is off (renders use threads).
+    """
+    global _render_pool
+    if not settings.OCR_RENDER_IN_PROCESS_POOL:
+        return None
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=render_pool_workers(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        print(f"✅ Render process pool started ({render_pool_workers()} workers)")
+    return _render_pool
+
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+async def render_pdf_page(pdf_path: str, page_num: int, pdf_bytes: Optional[bytes] = None) -> dict:
+    """
+    Rasterize one PDF page (0-based) for OCR in the render pool. With
+    pdf_bytes the document is rendered from memory and pdf_path is only the
+    key workers cache the opened document under. Without a pool the page is
+    rendered on a thread from a document opened just for it. pdf_bytes is
+    pickled into the pool on every call, so pool renders should get a path.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    if pool is None:
+        return await asyncio.to_thread(render_pdf_page_isolated, pdf_path, page_num, _render_options(), pdf_bytes)
+    try:
+        return await loop.run_in_executor(
+            pool, render_page_file, pdf_path, page_num, _render_options(), pdf_bytes
+        )
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge page); start a fresh pool next time
+        shutdown_render_pool()
+        raise
+
+
+def _spill_pdf(data: bytes) -> str:
+    """Write an in-memory PDF to UPLOAD_DIR once, so render pool workers can open it by path"""
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=settings.UPLOAD_DIR)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _ocr_page_result(page_number: int, text: str, rendered: dict) -> dict:
+    # Clean the OCR output
+    text = clean_ocr_text(text)
+    print(
+        f"✅ Page {page_number} OCR complete - extracted {len(text)} characters "
+        f"(zoom {rendered['zoom']}, {rendered['width']}x{rendered['height']}, "
+        f"payload {rendered['payload_bytes'] / 1024:.0f} KB)"
+    )
+    return {
+        'page_number': page_number,
+        'content': text,
+        'extraction_method': 'ocr',
+        'payload_bytes': rendered['payload_bytes']
+    }
+
+
+def _ocr_page_error(page_number: int, error: Exception) -> dict:
+    print(f"❌ Page {page_number} OCR failed: {str(error)}")
+    return {
+        'page_number': page_number,
+        'content': f"[OCR Error: {str(error)}]",
+        'extraction_method': 'ocr',
+        'error': str(error)
+    }
+
+
+def _estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Input tokens GPT-4o bills for a detail=high image: fit into 2048x2048,
+    scale the short side down to 768, then 170 per 512px tile plus 85.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _pack_ocr_batches(items: list) -> list:
+    """
+    Group (page_num, rendered) items into batches for one vision request each.
+    A batch holds at most settings.OCR_BATCH_MAX_PAGES pages and its estimated
+    image tokens plus reserved output tokens stay within OCR_BATCH_TOKEN_BUDGET.
+    """
+    batches, current, used = [], [], 0
+    for item in items:
+        rendered = item[1]
+        cost = _estimate_image_tokens(rendered['width'], rendered['height']) + settings.OCR_BATCH_OUTPUT_TOKENS_PER_PAGE
+        if current and (used + cost > settings.OCR_BATCH_TOKEN_BUDGET or len(current) >= settings.OCR_BATCH_MAX_PAGES):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def extract_from_pdf(
+    pdf_path: str,
+    mode: Optional[str] = None,
+    job_id: Optional[str] = None,
+    assignment_id: Optional[str] = None,
+    ocr_page_numbers: Optional[set] = None,
+    data: Optional[bytes] = None,
+    on_progress=None
+) -> list:
+    """
+    Extract text from ALL pages of PDF
+
+    mode "ocr" forces vision OCR on every page. mode "hybrid" (the default,
+    see settings.OCR_PDF_MODE) reads each page's text layer first and only sends
+    pages whose text layer scores below settings.OCR_TEXT_LAYER_MIN_SCORE to OCR.
+    Each page is tagged 'direct' or 'ocr' in extraction_method.
+
+    Before OCR, a low-resolution pixel pass flags blank pages (kept in the list
+    with extraction_method 'skipped' and skipped_blank=True) and near-identical
+    pages (which reuse the earlier page's OCR text and carry duplicate_of).
+
+    Pages are rasterized in a process pool (see get_render_pool) and OCR'd
+    concurrently (up to settings.OCR_PAGE_CONCURRENCY at a time).
+    With settings.OCR_BATCH_MODE, several pages share one vision request (see
+    _pack_ocr_batches); the page dicts come back in the same shape either way.
+    The returned list keeps page order, and a page that fails is reported with an
+    'error' key instead of aborting the whole document.
+
+    With a job_id, every finished page is checkpointed as soon as it lands, and a
+    later call with the same job_id only processes the pages still missing.
+    on_progress, if given, is awaited after each checkpoint with the full page
+    list so far; pages not done yet are extraction_method 'pending'.
+
+    ocr_page_numbers (1-based) restricts which pages may go to vision OCR; other
+    pages that need OCR come back as extraction_method 'pending' with empty
+    content. Text-layer, blank and resolvable duplicate pages are always filled.
+
+    data, if given, is the PDF content; it is opened from memory and pdf_path
+    only names the document. If pages go to the render pool, the content is
+    spilled to a temp file once and workers get its path instead of the bytes.
+    """
+    mode = (mode or settings.OCR_PDF_MODE).lower()
+    if mode not in ('hybrid', 'ocr'):
+        raise ValueError(f"Unsupported PDF extraction mode: {mode}")
+
+    if data is not None:
+        doc = await asyncio.to_thread(fitz.open, stream=data, filetype="pdf")
+    else:
+        doc = await asyncio.to_thread(fitz.open, pdf_path)
+    total_pages = len(doc)
+    concurrency = max(1, settings.OCR_PAGE_CONCURRENCY)
+    semaphore = asyncio.Semaphore(concurrency)
+    render_lock = threading.Lock()
+    # What page renders open: replaced by a spilled copy for the render pool
+    render_path, render_data = pdf_path, data
+
+    print(f"📄 Starting extraction for PDF with {total_pages} pages (mode: {mode}, concurrency: {concurrency})...")
+
+    async def _checkpoint(pages: list):
+        if job_id:
+            await db_service.checkpoint_ocr_pages(job_id, pages)
+        if on_progress and pages:
+            for page in pages:
+                all_pages[page['page_number'] - 1] = page
+            await on_progress([
+                page or {'page_number': n + 1, 'content': '', 'extraction_method': 'pending'}
+                for n, page in enumerate(all_pages)
+            ])
+
+    def _read_text_layers(page_nums: list) -> list:
+        pages = []
+        with render_lock:
+            for page_num in page_nums:
+                page = doc[page_num]
+                text = page.get_text()
+                score = score_text_layer(text, abs(page.rect), _image_coverage(page))
+                pages.append((text, score))
+        return pages
+
+    def _scan_pages(page_nums: list) -> list:
+        with render_lock:
+            return [_page_pixel_stats(doc[page_num]) for page_num in page_nums]
+
+    ink_masks = {}
+
+    def _confirm_duplicate(page_num: int, original: int) -> bool:
+        with render_lock:
+            for n in (page_num, original):
+                if n not in ink_masks:
+                    ink_masks[n] = _ink_mask(doc[n])
+        return _ink_masks_match(ink_masks[page_num], ink_masks[original])
+
+    async def _render_for_ocr(page_num: int) -> dict:
+        rendered = await render_pdf_page(render_path, page_num, render_data)
+        _record_render(rendered)
+        return rendered
+
+    async def _process_pages_pipelined(page_nums: list) -> list:
+        """
+        Two-stage pipeline: pages are rasterized in the render pool and handed
+        to `concurrency` OCR workers through a bounded queue, so rendering of
+        later pages overlaps with OCR of earlier ones. A full queue stalls
+        rendering until OCR catches up, which bounds rendered pages in memory.
+        """
+        queue = asyncio.Queue(maxsize=max(1, settings.OCR_RENDER_QUEUE_SIZE))
+        render_slots = asyncio.Semaphore(render_pool_workers())
+        results = {}
+
+        async def _render(page_num: int):
+            async with render_slots:
+                try:
+                    rendered = await _render_for_ocr(page_num)
+                except Exception as e:
+                    rendered = e
+                await queue.put((page_num, rendered))
+
+        async def _produce():
+            await asyncio.gather(*[_render(n) for n in page_nums])
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        async def _consume():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                page_num, rendered = item
+                if isinstance(rendered, Exception):
+                    results[page_num] = _ocr_page_error(page_num + 1, rendered)
+                    continue
+
+                print(f"🔍 Processing page {page_num + 1}/{total_pages} with OCR...")
+                try:
+                    ocr_text = await _ocr_image_cached(rendered['image_bytes'], rendered['mime_type'])
+                except Exception as e:
+                    results[page_num] = _ocr_page_error(page_num + 1, e)
+                    continue
+
+                results[page_num] = _ocr_page_result(page_num + 1, ocr_text, rendered)
+                await _checkpoint([results[page_num]])
+
+        await asyncio.gather(_produce(), *[_consume() for _ in range(concurrency)])
+        return [results[n] for n in page_nums]
+
+    async def _process_pages_batched(page_nums: list) -> list:
+        results = {}
+
+        async def _prepare(page_num: int):
+            async with semaphore:
+                try:
+                    rendered = await _render_for_ocr(page_num)
+                    rendered['content_hash'] = hashlib.sha256(rendered['image_bytes']).hexdigest()
+                    cached_text = await db_service.get_cached_page_ocr(rendered['content_hash'])
+                except Exception as e:
+                    results[page_num] = _ocr_page_error(page_num + 1, e)
+                    return None
+            if cached_text is not None:
+                results[page_num] = _ocr_page_result(page_num + 1, cached_text, rendered)
+                return None
+            return page_num, rendered
+
+        prepared = await asyncio.gather(*[_prepare(n) for n in page_nums])
+        batches = _pack_ocr_batches([item for item in prepared if item])
+        print(f"📦 Batching {sum(len(b) for b in batches)} pages into {len(batches)} vision requests")
+
+        async def _run_batch(batch: list):
+            async with semaphore:
+                try:
+                    texts = await _vision_ocr_batch([(n + 1, rendered) for n, rendered in batch])
+                except Exception as e:
+                    print(f"❌ Batch OCR failed for pages {[n + 1 for n, _ in batch]}: {str(e)}")
+                    texts = {}
+
+            for page_num, rendered in batch:
+                text = texts.get(page_num + 1)
+                try:
+                    if text is None:
+                        # Not split out of the batch response - OCR this page on its own
+                        print(f"↩️ Page {page_num + 1} missing from batch response - OCR'ing it alone")
+                        text = await _vision_ocr(rendered['image_bytes'], rendered['mime_type'])
+                    await _save_page_text(rendered['content_hash'], text)
+                except Exception as e:
+                    results[page_num] = _ocr_page_error(page_num + 1, e)
+                    continue
+                results[page_num] = _ocr_page_result(page_num + 1, text, rendered)
+
+            await _checkpoint([results[page_num] for page_num, _ in batch])
+
+        await asyncio.gather(*[_run_batch(batch) for batch in batches])
+        return [results[n] for n in page_nums]
+
+    try:
+        all_pages = [None] * total_pages
+        if job_id:
+            done = await db_service.start_ocr_job(job_id, os.path.basename(pdf_path), total_pages, assignment_id)
+            for page_number, page in done.items():
+                if 1 <= page_number <= total_pages:
+                    all_pages[page_number - 1] = page
+
+        pending = [n for n in range(total_pages) if all_pages[n] is None]
+        ocr_page_nums = list(pending)
+
+        if mode == 'hybrid' and pending:
+            ocr_page_nums = []
+            text_layers = await asyncio.to_thread(_read_text_layers, pending)
+            for page_num, (text, score) in zip(pending, text_layers):
+                if score >= settings.OCR_TEXT_LAYER_MIN_SCORE:
+                    print(f"📝 Page {page_num + 1} text layer OK (score {score}) - {len(text.strip())} characters")
+                    all_pages[page_num] = {
+                        'page_number': page_num + 1,
+                        'content': text.strip(),
+                        'extraction_method': 'direct'
+                    }
+                else:
+                    print(f"🖼️ Page {page_num + 1} text layer score {score} - falling back to OCR")
+                    ocr_page_nums.append(page_num)
+
+        duplicates = {}
+        if ocr_page_nums and (settings.OCR_SKIP_BLANK_PAGES or settings.OCR_SKIP_DUPLICATE_PAGES):
+            page_stats = await asyncio.to_thread(_scan_pages, ocr_page_nums)
+            ocr_page_nums, blank_pages, duplicates = await asyncio.to_thread(
+                _plan_page_skips, ocr_page_nums, page_stats, _confirm_duplicate
+            )
+
+            for page_num in blank_pages:
+                print(f"⬜ Page {page_num + 1} is blank - skipping OCR")
+                all_pages[page_num] = {
+                    'page_number': page_num + 1,
+                    'content': '',
+                    'extraction_method': 'skipped',
+                    'skipped_blank': True
+                }
+            for page_num, original in duplicates.items():
+                print(f"♻️ Page {page_num + 1} duplicates page {original + 1} - reusing its OCR")
+
+        if ocr_page_numbers is not None:
+            deferred = [n for n in ocr_page_nums if n + 1 not in ocr_page_numbers]
+            ocr_page_nums = [n for n in ocr_page_nums if n + 1 in ocr_page_numbers]
+            # A duplicate can only be filled if its original is OCR'd in this pass
+            deferred_set = set(deferred)
+            for page_num, original in list(duplicates.items()):
+                if original in deferred_set:
+                    del duplicates[page_num]
+                    deferred.append(page_num)
+            for page_num in deferred:
+                all_pages[page_num] = {
+                    'page_number': page_num + 1,
+                    'content': '',
+                    'extraction_method': 'pending'
+                }
+            if deferred:
+                print(f"⏸️ Deferring OCR of {len(deferred)} pages")
+
+        if data is not None and ocr_page_nums and get_render_pool() is not None:
+            render_path, render_data = await asyncio.to_thread(_spill_pdf, data), None
+
+        if settings.OCR_BATCH_MODE and len(ocr_page_nums) > 1:
+            ocr_pages = await _process_pages_batched(ocr_page_nums)
+        else:
+            ocr_pages = await _process_pages_pipelined(ocr_page_nums)
+        for page_num, page in zip(ocr_page_nums, ocr_pages):
+            all_pages[page_num] = page
+
+        for page_num, original in duplicates.items():
+            page = dict(all_pages[original])
+            page.pop('payload_bytes', None)
+            page['page_number'] = page_num + 1
+            page['duplicate_of'] = original + 1
+            all_pages[page_num] = page
+
+        # OCR'd pages were checkpointed as they finished; store the cheap ones too
+        await _checkpoint([
+            all_pages[n] for n in pending
+            if all_pages[n]['extraction_method'] in ('direct', 'skipped') or n in duplicates
+        ])
+    finally:
         doc.close()
-        print(f"✅ PDF OCR complete - processed {len(all_pages)} pages")
-        return all_pages
-    
-    return await asyncio.to_thread(_extract_pdf)
+        if render_path != pdf_path:
+            try:
+                os.remove(render_path)
+            except OSError as e:
+                print(f"Failed to cleanup file {render_path}: {e}")
 
+    failed_pages = [p['page_number'] for p in all_pages if p.get('error')]
+    if job_id:
+        pending_pages = [p['page_number'] for p in all_pages if p['extraction_method'] == 'pending']
+        await db_service.finish_ocr_job(job_id, failed_pages, pending_pages)
+    if failed_pages:
+        print(f"⚠️ PDF extraction finished with {len(failed_pages)} failed pages: {failed_pages}")
+    methods = Counter(p['extraction_method'] for p in all_pages)
+    print(
+        f"✅ PDF extraction complete - {total_pages} pages ({methods['direct']} direct, "
+        f"{methods['ocr'] - len(duplicates)} OCR, {len(duplicates)} duplicate, {methods['skipped']} blank, "
+        f"{methods['pending']} pending)"
+    )
+    return all_pages
 
-async def extract_from_image(image_path: str) -> list:
+
+async def extract_from_image(image_path: str, data: Optional[bytes] = None) -> list:
     """
     Extract text from image using OCR
     """
-    def _extract_image():
-        print(f"📄 Running OCR on image...")
+    def _read_image() -> bytes:
         with open(image_path, 'rb') as img_file:
-            img_data = img_file.read()
-        
-        text = _ocr_image_bytes_sync(img_data)
-        text = clean_ocr_text(text)
-        print(f"✅ Image OCR complete - extracted {len(text)} characters")
-        
-        return [{
-            'page_number': 1,
-            'content': text,
-            'extraction_method': 'ocr'
-        }]
-    
-    return await asyncio.to_thread(_extract_image)
+            return img_file.read()
+
+    print(f"📄 Running OCR on image...")
+    img_data = data if data is not None else await asyncio.to_thread(_read_image)
 
+    mime_type = IMAGE_MIME_TYPES.get(os.path.splitext(image_path)[1].lower(), "image/png")
+    text = await ocr_image_bytes(img_data, mime_type)
+    text = clean_ocr_text(text)
+    print(f"✅ Image OCR complete - extracted {len(text)} characters")
 
-async def extract_from_docx(docx_path: str) -> list:
+    return [{
+        'page_number': 1,
+        'content': text,
+        'extraction_method': 'ocr'
+    }]
+
+
+async def extract_from_docx(docx_path: str, data: Optional[bytes] = None) -> list:
     """
     Extract text from DOCX file
     """
     def _extract_docx():
         print(f"📄 Extracting text from DOCX...")
-        doc = Document(docx_path)
+        doc = Document(io.BytesIO(data) if data is not None else docx_path)
         text = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
         
         print(f"✅ DOCX extraction complete - extracted {len(text)} characters")
@@ -128,14 +787,17 @@ async def extract_from_docx(docx_path: str) -> list:
     return await asyncio.to_thread(_extract_docx)
 
 
-async def extract_from_txt(txt_path: str) -> list:
+async def extract_from_txt(txt_path: str, data: Optional[bytes] = None) -> list:
     """
     Extract text from TXT file
     """
     def _extract_txt():
         print(f"📄 Reading TXT file...")
-        with open(txt_path, 'r', encoding='utf-8') as file:
-            text = file.read()
+        if data is not None:
+            text = data.decode('utf-8')
+        else:
+            with open(txt_path, 'r', encoding='utf-8') as file:
+                text = file.read()
         
         print(f"✅ TXT reading complete - extracted {len(text)} characters")
         
@@ -148,64 +810,198 @@ async def extract_from_txt(txt_path: str) -> list:
     return await asyncio.to_thread(_extract_txt)
 
 
-def _ocr_image_bytes_sync(image_bytes: bytes) -> str:
+async def _vision_ocr(image_bytes: bytes, mime_type: str = "image/png") -> str:
     """
-    Use GPT-4 Vision to extract text from image (SYNCHRONOUS)
+    Use GPT-4 Vision to extract text from image (raises on failure)
     """
     if not client:
         raise RuntimeError("OpenAI API key is not configured. Please set OPENAI_API_KEY in your .env file.")
     
     base64_image = base64.b64encode(image_bytes).decode('utf-8')
     
+    messages = [{
+        "role": "user",
+        "content": [
+            {
+                "type": "text",
+                "text": OCR_PROMPT
+            },
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{mime_type};base64,{base64_image}",
+                    "detail": "high"
+                }
+            }
+        ]
+    }]
+
+    response = await _request_vision(messages, max_tokens=4096)
+    
+    extracted_text = response.choices[0].message.content
+    
+    if not extracted_text or len(extracted_text.strip()) < 10:
+        print("⚠️ Warning: OCR returned very little text")
+        return OCR_MINIMAL_TEXT_MARKER
+    
+    return extracted_text
+
+
+async def _vision_ocr_batch(pages: list) -> dict:
+    """
+    OCR several page images in one request. pages is a list of
+    (page_number, rendered) tuples; returns {page_number: text} for every
+    page whose delimiter was found in the response.
+    """
+    if not client:
+        raise RuntimeError("OpenAI API key is not configured. Please set OPENAI_API_KEY in your .env file.")
+
+    page_numbers = [page_number for page_number, _ in pages]
+    content = [{
+        "type": "text",
+        "text": OCR_BATCH_PROMPT.format(count=len(pages), pages=", ".join(str(n) for n in page_numbers))
+    }]
+    for page_number, rendered in pages:
+        base64_image = base64.b64encode(rendered['image_bytes']).decode('utf-8')
+        content.append({"type": "text", "text": f"PAGE {page_number}:"})
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{rendered['mime_type']};base64,{base64_image}",
+                "detail": "high"
+            }
+        })
+
+    # Same output ceiling per page as a single-page request, capped at the model limit
+    max_tokens = min(16384, 4096 * len(pages))
+    response = await _request_vision([{"role": "user", "content": content}], max_tokens=max_tokens)
+    return _split_batch_response(response.choices[0].message.content or "", page_numbers)
+
+
+def _split_batch_response(text: str, page_numbers: list) -> dict:
+    """Split a batched OCR response on its ===== PAGE n ===== delimiters"""
+    parts = PAGE_DELIMITER_RE.split(text)
+    # split() with one capture group gives [preamble, n1, text1, n2, text2, ...]
+    texts = {}
+    for number, page_text in zip(parts[1::2], parts[2::2]):
+        page_number = int(number)
+        if page_number in page_numbers and page_number not in texts:
+            page_text = page_text.strip()
+            texts[page_number] = page_text if len(page_text) >= 10 else OCR_MINIMAL_TEXT_MARKER
+    return texts
+
+
+async def _request_vision(messages: list, max_tokens: int):
+    """Send a vision request through the process-wide semaphore, tracking queue metrics"""
+    ocr_stats['queued'] += 1
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": """Extract ALL visible text from this document image exactly as it appears.
+        await OCR_SEMAPHORE.acquire()
+    finally:
+        ocr_stats['queued'] -= 1
 
-IMPORTANT RULES:
-1. Extract EVERY word, number, and symbol
-2. Maintain original formatting and structure
-3. Do NOT add markdown formatting (no ```, no **, no ##)
-4. Do NOT add code blocks
-5. Output plain text only
-6. Preserve line breaks and spacing as they appear
-7. Include all questions, instructions, and content
+    ocr_stats['in_flight'] += 1
+    try:
+        return await _create_with_retry(messages, max_tokens=max_tokens)
+    finally:
+        ocr_stats['in_flight'] -= 1
+        OCR_SEMAPHORE.release()
+
+
+async def _create_with_retry(messages: list, max_tokens: int):
+    """
+    chat.completions.create with exponential backoff on 429 / 5xx / connection errors.
+    Honours Retry-After when the provider sends one.
+    """
+    attempt = 0
+    while True:
+        ocr_stats['requests'] += 1
+        try:
+            return await client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0
+            )
+        except Exception as e:
+            if attempt >= settings.OCR_MAX_RETRIES or not _is_retryable(e):
+                ocr_stats['failed'] += 1
+                raise
+
+            delay = _retry_delay(e, attempt)
+            attempt += 1
+            ocr_stats['retried'] += 1
+            print(f"⏳ OCR request failed ({type(e).__name__}) - retry {attempt}/{settings.OCR_MAX_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, openai.APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        # An exhausted quota also comes back as 429 but will not recover by waiting
+        if getattr(error, 'code', None) == 'insufficient_quota':
+            return False
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    delay = settings.OCR_RETRY_BASE_DELAY * (2 ** attempt)
+
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get('retry-after')))
+        except (TypeError, ValueError):
+            pass
+
+    # Jitter so pages that failed together don't retry together
+    return min(delay, 60.0) * random.uniform(0.8, 1.2)
+
+
+def get_ocr_stats() -> dict:
+    stats = dict(ocr_stats)
+    rendered = stats['pages_rendered']
+    stats['avg_payload_bytes'] = stats['payload_bytes_total'] // rendered if rendered else 0
+    return stats
+
+
+async def close_ocr_client():
+    if client:
+        await client.close()
 
-Start extraction:"""
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{base64_image}",
-                            "detail": "high"
-                        }
-                    }
-                ]
-            }],
-            max_tokens=4096,
-            temperature=0
-        )
-        
-        extracted_text = response.choices[0].message.content
-        
-        if not extracted_text or len(extracted_text.strip()) < 10:
-            print("⚠️ Warning: OCR returned very little text")
-            return "[OCR Warning: Minimal text extracted]"
-        
-        return extracted_text
-        
-    except Exception as e:
-        print(f"❌ OCR Error: {str(e)}")
-        return f"[OCR Error: {str(e)}]"
+
+async def _ocr_image_cached(image_bytes: bytes, mime_type: str = "image/png") -> str:
+    """
+    OCR an image, consulting the content-hash page cache before calling the model.
+    Raises on OCR failure; failures and minimal-text warnings are never cached.
+    """
+    content_hash = hashlib.sha256(image_bytes).hexdigest()
+
+    cached_text = await db_service.get_cached_page_ocr(content_hash)
+    if cached_text is not None:
+        return cached_text
+
+    text = await _vision_ocr(image_bytes, mime_type)
+    await _save_page_text(content_hash, text)
+    return text
+
+
+async def _save_page_text(content_hash: str, text: str):
+    """Cache a page's OCR text, unless it is the minimal-text marker of one bad response"""
+    if text != OCR_MINIMAL_TEXT_MARKER:
+        await db_service.save_page_ocr_cache(content_hash, text)
 
 
-async def ocr_image_bytes(image_bytes: bytes) -> str:
+async def ocr_image_bytes(image_bytes: bytes, mime_type: str = "image/png") -> str:
     """
-    Async wrapper for OCR
+    Async OCR with page cache (errors are returned as an [OCR Error] marker)
     """
-    return await asyncio.to_thread(_ocr_image_bytes_sync, image_bytes)
\ No newline at end of file
+    if not client:
+        raise RuntimeError("OpenAI API key is not configured. Please set OPENAI_API_KEY in your .env file.")
+
+    try:
+        return await _ocr_image_cached(image_bytes, mime_type)
+    except Exception as e:
+        print(f"❌ OCR Error: {str(e)}")
+        return f"[OCR Error: {str(e)}]"
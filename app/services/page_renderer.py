@@ -0,0 +1,139 @@
+# PDF page rasterization for vision OCR.
+# Runs inside the OCR render process pool (see ocr_service.get_render_pool), so
+# this module must stay light: no settings, clients or database handles. Render
+# options arrive as a plain dict built by ocr_service._render_options().
+import io
+import os
+from typing import Optional
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# Per-process handle on the most recently opened PDF, so rendering the pages of
+# one document in the same pool worker doesn't reopen the file every time.
+# Only pool workers use it: they render one page at a time, threads don't.
+_open_doc = {'key': None, 'doc': None}
+
+
+def render_pdf_page(pdf_path: str, page_num: int, options: dict, pdf_bytes: Optional[bytes] = None) -> dict:
+    """
+    Open (or reuse) the PDF in this pool worker and render one page for OCR.
+    page_num is 0-based. With pdf_bytes the document is opened from memory
+    and pdf_path is only its cache key.
+    """
+    return render_page_image(_get_doc(pdf_path, pdf_bytes)[page_num], options)
+
+
+def render_pdf_page_isolated(pdf_path: str, page_num: int, options: dict, pdf_bytes: Optional[bytes] = None) -> dict:
+    """
+    Same as render_pdf_page, but on a document opened for this call only.
+    Used when rendering on threads: PyMuPDF documents aren't thread-safe, so
+    threads must not share _open_doc.
+    """
+    doc = _open_pdf(pdf_path, pdf_bytes)
+    try:
+        return render_page_image(doc[page_num], options)
+    finally:
+        doc.close()
+
+
+def _open_pdf(pdf_path: str, pdf_bytes: Optional[bytes] = None):
+    if pdf_bytes is not None:
+        return fitz.open(stream=pdf_bytes, filetype="pdf")
+    return fitz.open(pdf_path)
+
+
+def _get_doc(pdf_path: str, pdf_bytes: Optional[bytes] = None):
+    if pdf_bytes is not None:
+        key = (pdf_path, len(pdf_bytes))
+    else:
+        stat = os.stat(pdf_path)
+        key = (pdf_path, stat.st_mtime_ns, stat.st_size)
+    if _open_doc['key'] != key:
+        if _open_doc['doc'] is not None:
+            _open_doc['doc'].close()
+        _open_doc['doc'] = _open_pdf(pdf_path, pdf_bytes)
+        _open_doc['key'] = key
+    return _open_doc['doc']
+
+
+def _dominant_font_size(page) -> Optional[float]:
+    """Median font size (pt) of the page's text layer, None for image-only pages"""
+    sizes = []
+    for block in page.get_text("dict", flags=0).get("blocks", []):
+        for line in block.get("lines", []):
+            for span in line.get("spans", []):
+                if span.get("text", "").strip():
+                    sizes.append(span["size"])
+    if not sizes:
+        return None
+    sizes.sort()
+    return sizes[len(sizes) // 2]
+
+
+def _pick_render_zoom(page, options: dict) -> float:
+    """
+    Choose a render zoom from the page size and text size.
+
+    The short side is scaled to options['target_px'], then bumped up if that
+    would leave the dominant font smaller than options['min_glyph_px'].
+    """
+    short_side = min(page.rect.width, page.rect.height) or 1
+    zoom = options['target_px'] / short_side
+
+    font_size = _dominant_font_size(page)
+    if font_size:
+        zoom = max(zoom, options['min_glyph_px'] / font_size)
+
+    return min(max(zoom, options['min_zoom']), options['max_zoom'])
+
+
+def _trim_margins(img: Image.Image) -> Image.Image:
+    """Crop near-white margins, keeping a small border around the content"""
+    gray = img if img.mode == "L" else img.convert("L")
+    # Anything darker than 232 counts as content
+    content = gray.point(lambda v: 255 if v < 232 else 0)
+    bbox = content.getbbox()
+    if not bbox:
+        return img
+
+    pad = 16
+    left, top, right, bottom = bbox
+    bbox = (max(0, left - pad), max(0, top - pad), min(img.width, right + pad), min(img.height, bottom + pad))
+    return img.crop(bbox)
+
+
+def render_page_image(page, options: dict) -> dict:
+    """
+    Render a PDF page for vision OCR using adaptive zoom, optional grayscale,
+    margin trimming and PNG / bounded-quality JPEG encoding.
+
+    Returns image_bytes, mime_type, zoom, width, height and payload_bytes (the
+    size of the base64 data URL payload that will be sent to the model).
+    """
+    zoom = _pick_render_zoom(page, options)
+    colorspace = fitz.csGRAY if options['grayscale'] else fitz.csRGB
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=colorspace, alpha=False)
+
+    img = Image.frombytes("L" if pix.n == 1 else "RGB", (pix.width, pix.height), pix.samples)
+    if options['trim_margins']:
+        img = _trim_margins(img)
+
+    buffer = io.BytesIO()
+    if options['image_format'].lower() in ("jpeg", "jpg"):
+        quality = min(max(options['jpeg_quality'], 30), 95)
+        img.save(buffer, format="JPEG", quality=quality, optimize=True)
+        mime_type = "image/jpeg"
+    else:
+        img.save(buffer, format="PNG")
+        mime_type = "image/png"
+
+    image_bytes = buffer.getvalue()
+    return {
+        'image_bytes': image_bytes,
+        'mime_type': mime_type,
+        'zoom': round(zoom, 2),
+        'width': img.width,
+        'height': img.height,
+        'payload_bytes': 4 * ((len(image_bytes) + 2) // 3)
+    }
@@ -20,6 +20,9 @@ s3_client = boto3.client(
 # Semaphore to limit concurrent S3 uploads (max 10 at a time)
 S3_SEMAPHORE = asyncio.Semaphore(10)
 
+# Smallest part S3 accepts in a multipart upload (except the last one)
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
 
 async def upload_to_s3(file_path: str, assignment_id: str, original_filename: str) -> str:
     """
@@ -42,10 +45,119 @@ async def upload_to_s3(file_path: str, assignment_id: str, original_filename: st
             )
         )
         
-        # Generate URL
-        url = f"https://{settings.S3_BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com/{s3_key}"
-        
-        return url
+        return _object_url(s3_key)
+
+
+async def download_from_s3(s3_key: str, dest_path: str):
+    """Download an S3 object to a local file (rate limited like uploads)"""
+    async with S3_SEMAPHORE:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            None,
+            partial(s3_client.download_file, settings.S3_BUCKET_NAME, s3_key, dest_path)
+        )
+
+
+def _object_url(s3_key: str) -> str:
+    return f"https://{settings.S3_BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com/{s3_key}"
+
+
+class S3MultipartUpload:
+    """
+    Streaming S3 upload of an assignment file: chunks passed to write() are
+    buffered into settings.S3_MULTIPART_PART_SIZE parts and sent as a multipart
+    upload, one part in flight while the next is being filled. Nothing touches
+    the local disk. Call complete() to get the URL, or abort() on failure.
+    """
+
+    def __init__(self, assignment_id: str, original_filename: str):
+        file_extension = os.path.splitext(original_filename)[1]
+        self.s3_key = f"assignments/{assignment_id}{file_extension}"
+        self.content_type = get_content_type(file_extension)
+        self.upload_id = None
+        self._buffer = bytearray()
+        self._parts = []
+        self._part_count = 0
+        self._pending = None
+
+    async def _call(self, method, **kwargs):
+        # Semaphore per S3 call, so a slow client doesn't hold a slot between parts
+        async with S3_SEMAPHORE:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, partial(method, **kwargs))
+
+    async def start(self):
+        response = await self._call(
+            s3_client.create_multipart_upload,
+            Bucket=settings.S3_BUCKET_NAME,
+            Key=self.s3_key,
+            ContentType=self.content_type
+        )
+        self.upload_id = response['UploadId']
+
+    async def _upload_part(self, part_number: int, body: bytes):
+        response = await self._call(
+            s3_client.upload_part,
+            Bucket=settings.S3_BUCKET_NAME,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    async def _flush(self):
+        if self._pending is not None:
+            await self._pending
+        body = bytes(self._buffer)
+        self._buffer.clear()
+        self._part_count += 1
+        self._pending = asyncio.ensure_future(self._upload_part(self._part_count, body))
+
+    async def write(self, chunk: bytes):
+        if self.upload_id is None:
+            await self.start()
+        self._buffer.extend(chunk)
+        if len(self._buffer) >= max(settings.S3_MULTIPART_PART_SIZE, S3_MIN_PART_SIZE):
+            await self._flush()
+
+    async def complete(self) -> str:
+        if self.upload_id is None:
+            await self.start()
+        # The last part may be smaller than the 5MB S3 minimum (or empty for an empty file)
+        if self._buffer or self._part_count == 0:
+            await self._flush()
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+
+        await self._call(
+            s3_client.complete_multipart_upload,
+            Bucket=settings.S3_BUCKET_NAME,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': sorted(self._parts, key=lambda part: part['PartNumber'])}
+        )
+        return _object_url(self.s3_key)
+
+    async def abort(self):
+        if self._pending is not None:
+            try:
+                await self._pending
+            except Exception:
+                pass
+            self._pending = None
+        if self.upload_id is None:
+            return
+        try:
+            await self._call(
+                s3_client.abort_multipart_upload,
+                Bucket=settings.S3_BUCKET_NAME,
+                Key=self.s3_key,
+                UploadId=self.upload_id
+            )
+        except Exception as e:
+            logger.error(f"❌ Failed to abort multipart upload {self.s3_key}: {e}")
 
 
 async def upload_mindmap_to_s3(
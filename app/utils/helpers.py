@@ -39,13 +39,14 @@ def validate_file_size(file_path: str, max_size_mb: int = 10) -> bool:
 
 def generate_file_hash(file_path: str) -> str:
     """
-    Generate MD5 hash of file for duplicate detection
+    Generate SHA-256 hash of file for duplicate detection
+    (same digest stream_uploaded_file computes while streaming)
     """
-    hash_md5 = hashlib.md5()
+    hash_sha256 = hashlib.sha256()
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+        for chunk in iter(lambda: f.read(1048576), b""):
+            hash_sha256.update(chunk)
+    return hash_sha256.hexdigest()
 
 
 def format_timestamp(dt: datetime = None) -> str:
@@ -0,0 +1,111 @@
+# Ingest worker: processes async uploads queued by
+# POST /api/assignments/upload-multiple?async_mode=true
+#
+# Run with: python -m app.worker
+#
+# Jobs live in the ingest_jobs Mongo collection. A worker leases a job, renews
+# the lease while it runs, and a job whose lease expires (worker crashed) is
+# picked up again by another worker, up to INGEST_MAX_ATTEMPTS. A worker that
+# loses its lease cancels the job. OCR is checkpointed per page, so a retried
+# job resumes where the previous attempt stopped.
+import asyncio
+import os
+import signal
+import socket
+
+from app.config import settings
+from app.services import db_service
+from app.services.ingest_service import run_ingest_job
+from app.services.ocr_service import close_ocr_client, shutdown_render_pool
+
+
+async def _renew_lease(job_id: str, worker_id: str, work: asyncio.Task):
+    """Keep the lease alive while work runs; cancel work if another worker took the job over"""
+    interval = max(1, settings.INGEST_LEASE_SECONDS // 3)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            renewed = await db_service.renew_ingest_lease(job_id, worker_id, settings.INGEST_LEASE_SECONDS)
+        except Exception as e:
+            print(f"❌ Lease renewal error on ingest job {job_id}: {e}")
+            continue
+        if not renewed:
+            print(f"⚠️ Lost lease on ingest job {job_id} - cancelling it here")
+            work.cancel()
+            return
+
+
+async def _process_job(job: dict, worker_id: str):
+    job_id = job["_id"]
+    print(f"\n🛠️ Ingest job {job_id}: {job['file_name']} (attempt {job['attempts']})")
+    work = asyncio.create_task(run_ingest_job(job))
+    heartbeat = asyncio.create_task(_renew_lease(job_id, worker_id, work))
+    try:
+        data = await work
+        await db_service.finish_ingest_job(job_id, worker_id, "processed", timings=data["timings"], error=None)
+        print(f"✅ Ingest job {job_id} done in {data['timings']['total']}s")
+    except asyncio.CancelledError:
+        # The heartbeat only ends on its own after cancelling a job it lost;
+        # the worker that holds the lease now owns the job's state
+        if not heartbeat.done():
+            raise
+        print(f"🛑 Ingest job {job_id} abandoned - another worker holds it now")
+    except Exception as e:
+        retry = job["attempts"] < settings.INGEST_MAX_ATTEMPTS
+        await db_service.finish_ingest_job(job_id, worker_id, "queued" if retry else "failed", error=str(e))
+        print(f"❌ Ingest job {job_id} failed ({'will retry' if retry else 'giving up'}): {str(e)}")
+    finally:
+        heartbeat.cancel()
+
+
+async def run_worker():
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    await db_service.connect_db()
+    db_service.open_http_client()
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    concurrency = max(1, settings.INGEST_WORKER_CONCURRENCY)
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    print(f"✅ Ingest worker {worker_id} started (concurrency: {concurrency})")
+    try:
+        while not stop.is_set():
+            await slots.acquire()
+            try:
+                job = await db_service.claim_ingest_job(worker_id, settings.INGEST_LEASE_SECONDS)
+            except Exception as e:
+                print(f"❌ Ingest job claim error: {e}")
+                job = None
+
+            if not job:
+                slots.release()
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=settings.INGEST_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(_process_job(job, worker_id))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+    finally:
+        # Let in-flight jobs finish; anything killed mid-way is re-leased later
+        if running:
+            print(f"⏳ Waiting for {len(running)} ingest jobs to finish...")
+            await asyncio.gather(*running, return_exceptions=True)
+        await close_ocr_client()
+        shutdown_render_pool()
+        await db_service.close_http_client()
+        await db_service.close_db()
+        print("❌ Ingest worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
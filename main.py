@@ -58,7 +58,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.routes import assignments, chatbot, mindmap  # Added mindmap
-from app.services.db_service import connect_db, close_db
+from app.routes.assignments import sweep_abandoned_uploads
+from app.services.db_service import connect_db, close_db, open_http_client, close_http_client
+from app.services.ocr_service import get_ocr_stats, close_ocr_client, shutdown_render_pool
+from app.services.assignment_cache import assignment_cache
+from app.services.db_indexes import ensure_indexes
+from app.config import settings
+import asyncio
 import os
 
 @asynccontextmanager
@@ -66,11 +72,23 @@ async def lifespan(app: FastAPI):
     # Startup
     os.makedirs("temp", exist_ok=True)
     await connect_db()
+    index_build = None
+    if settings.MONGO_ENSURE_INDEXES:
+        # create_indexes waits for the build, so don't hold up startup on it
+        index_build = asyncio.create_task(ensure_indexes())
+    open_http_client()
+    upload_sweeper = asyncio.create_task(sweep_abandoned_uploads())
     print("✅ Database connected")
     print("✅ Temp folder created")
     yield
     # Shutdown
+    upload_sweeper.cancel()
+    if index_build is not None and not index_build.done():
+        index_build.cancel()
     await close_db()
+    await close_http_client()
+    await close_ocr_client()
+    shutdown_render_pool()
     print("❌ Database disconnected")
 
 app = FastAPI(
@@ -111,4 +129,12 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/metrics/ocr")
+async def ocr_metrics():
+    return get_ocr_stats()
+
+@app.get("/metrics/assignment-cache")
+async def assignment_cache_metrics():
+    return assignment_cache.get_stats()
+
 # Run with: uvicorn main:app --reload --timeout-keep-alive 300 --limit-concurrency 1000
\ No newline at end of file